@@ -0,0 +1,72 @@
+# Project: Haptyc
+# Author: Evan Custodio (@defparam)
+#
+# Benchmark: tests per second of the serial "for test in TestFactory" loop versus
+# "async for" with async transforms which await a (simulated) network lookup. The
+# async tests are checked against the serial tests of the same transforms.
+#
+# Usage: python3 benchmarks/async_bench.py [tests] [latency in ms]
+
+import os, sys, time, asyncio
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from haptyc import *
+
+TESTS = 200
+if len(sys.argv) > 1:
+    TESTS = int(sys.argv[1])
+LATENCY = 0.005
+if len(sys.argv) > 2:
+    LATENCY = float(sys.argv[2]) / 1000
+
+class SyncLogic(Transform):
+    @ApplyList(["alpha", "beta", "gamma", "delta"])
+    def test_name(self, data, state):
+        self.set_label(data)
+        return data + str(state.iter)
+
+    @ApplyIteration(TESTS)
+    def test_id(self, data, state):
+        time.sleep(LATENCY)
+        return "v%d" % state.iter
+
+class AsyncLogic(Transform):
+    @ApplyList(["alpha", "beta", "gamma", "delta"])
+    async def test_name(self, data, state):
+        await asyncio.sleep(0)
+        self.set_label(data)
+        return data + str(state.iter)
+
+    @ApplyIteration(TESTS)
+    async def test_id(self, data, state):
+        await asyncio.sleep(LATENCY)
+        return "v%d" % state.iter
+
+REQUESTS = [("sniper", "GET /?name=[+name]x[+end]&id=[+id]1[+end] HTTP/1.1\r\n\r\n"),
+            ("clusterbomb", "GET /?name=[%name]x[%end]&id=[%id]1[%end] HTTP/1.1\r\n\r\n"),
+            ("pitchfork", "GET /?name=[#name]x[#end]&id=[#id]1[#end] HTTP/1.1\r\n\r\n")]
+
+def serial(request):
+    factory = SyncLogic(request)
+    return [(test, factory.get_label()) for test in factory]
+
+async def concurrent(request, concurrency):
+    return [item async for item in AsyncLogic(request).aiter(concurrency, labels=True)]
+
+def bench(name, run):
+    start = time.time()
+    tests = run()
+    elapsed = time.time() - start
+    print("%-36s %8d tests %8.2fs %10.1f tests/s" % (name, len(tests), elapsed, len(tests) / elapsed))
+    return tests
+
+def main():
+    for mode, request in REQUESTS:
+        expected = bench("%s serial" % mode, lambda: serial(request))
+        for concurrency in [1, 2, 8, 32]:
+            tests = bench("%s async concurrency=%d" % (mode, concurrency), lambda: asyncio.run(concurrent(request, concurrency)))
+            if tests != expected:
+                raise Exception("async tests differ from the serial tests at concurrency %d" % concurrency)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+# Project: Haptyc
+# Author: Evan Custodio (@defparam)
+#
+# Benchmark: tests per second of the serial "for test in TestFactory" loop versus
+# Transform.parallel_iter with a CPU heavy transform (JSON/base64 re-encoding as
+# in examples/fuzz.py)
+#
+# Usage: python benchmarks/parallel_bench.py [tests] [workers]
+
+import os, sys, time, json
+from base64 import b64encode, b64decode
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from haptyc import *
+
+TESTS = 20000
+if len(sys.argv) > 1:
+    TESTS = int(sys.argv[1])
+
+# base64 encode raw bytes into a string that json can serialize on python 2 and 3
+def b64(data):
+    return b64encode(data).decode("ascii")
+
+class TestLogic(Transform):
+    @ApplyIteration(TESTS)
+    def test_jsonfuzz(self, data, state):
+        JA = json.loads(data)
+        for key in JA:
+            JA[key] = b64(random_insert(b64decode(JA[key]), list("!@#$%^&*()")))
+        return json.dumps(JA)
+
+REQUEST = "POST /api HTTP/1.1\r\nHost: example\r\n\r\n[+jsonfuzz]" + json.dumps(dict(("key%d" % i, b64(("value %d" % i * 8).encode("ascii"))) for i in range(32))) + "[+end]"
+
+def bench(name, tests):
+    start = time.time()
+    count = 0
+    for test in tests:
+        count += 1
+    elapsed = time.time() - start
+    print("%-36s %8d tests %8.2fs %10.1f tests/s" % (name, count, elapsed, count / elapsed))
+
+def main():
+    workers = None
+    if len(sys.argv) > 2:
+        workers = int(sys.argv[2])
+
+    bench("serial", TestLogic(REQUEST))
+    bench("parallel_iter(ordered=True)", TestLogic(REQUEST).parallel_iter(workers=workers, ordered=True))
+    bench("parallel_iter(ordered=False)", TestLogic(REQUEST).parallel_iter(workers=workers))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,37 @@
+# Project: Haptyc
+# Author: Evan Custodio (@defparam)
+#
+# Benchmark: radamsa mutations per second when spawning radamsa for every
+# mutation versus serving mutations from the batched RadamsaEngine
+#
+# Usage: python benchmarks/radamsa_bench.py [mutations]
+#
+# (radamsa is required to be installed)
+
+import os, sys, time
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from haptyc.transforms import radamsa_spawn, RadamsaEngine
+
+SAMPLE = "GET /api/v1/users?id=1337&name=haptyc HTTP/1.1"
+
+def bench(name, mutate, count):
+    start = time.time()
+    for i in range(count):
+        mutate(SAMPLE)
+    elapsed = time.time() - start
+    print("%-32s %8d mutations %8.2fs %10.1f mutations/s" % (name, count, elapsed, count / elapsed))
+
+def main():
+    count = 1000
+    if len(sys.argv) > 1:
+        count = int(sys.argv[1])
+
+    bench("spawn per mutation", lambda data: radamsa_spawn(data)[0], count)
+    for batch, workers in [(100, 0), (100, 2), (500, 4)]:
+        engine = RadamsaEngine(batch=batch, workers=workers)
+        bench("engine batch=%d workers=%d" % (batch, workers), engine.mutate, count)
+        engine.close()
+
+if __name__ == "__main__":
+    main()
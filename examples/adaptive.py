@@ -0,0 +1,29 @@
+from haptyc import *
+
+# Adaptive Fuzzing
+#
+# Example Annotated Request:
+#   GET /search?q=[+fuzz]shoes[+end] HTTP/1.1
+#
+# Every response is reported back to the transform, mutations which got a response of a
+# new class (status code, length or time) are mutated further
+class TestLogic(Transform):
+    @ApplyAdaptive(2000)
+    def test_fuzz(self, data, state):
+        if state.init:
+            return
+        data = random_insert(data, list("'\"<>;%{}()$"))
+        self.set_label(data)
+        return data
+
+def queueRequests(target, wordlists):
+    global TestFactory
+    engine = RequestEngine(endpoint=target.endpoint, concurrentConnections=1, requestsPerConnection=1, pipeline=0)
+
+    TestFactory = TestLogic(target.req)
+    for test in TestFactory:
+        engine.queue(test, label=TestFactory.get_label())
+
+def handleResponse(req, interesting):
+    TestFactory.feedback(label=req.label, status=req.status, length=req.length, time=req.time)
+    table.add(req)
@@ -21,14 +21,19 @@ class TestLogic(Transform):
         return state.blah[state.iter]
         
     # Transform that issues 1000 random_insert mutations of various characters, can be applied anywhere
-    @ApplyIteration(1000)
+    # The mutations are generated 100 at a time
+    @ApplyBatch(1000)
     def test_randinsert(self, data, state):
-        return random_insert(data, list(".#@$%^&*!'\"><;/\\"))
+        if state.init:
+            return
+        return random_insert_batch(data, list(".#@$%^&*!'\"><;/\\"), state.size)
     
     # Transform that issues 1000 random_insert mutations of characters that exist in the inner data, can be applied anywhere    
-    @ApplyIteration(1000)
+    @ApplyBatch(1000)
     def test_selfinsert(self, data, state):
-        return random_insert(data, list(set(list(data))))
+        if state.init:
+            return
+        return random_insert_batch(data, list(set(list(data))), state.size)
     
     # Transform that issues 1000 test that parses all cookies, selects a random cookie, performs a random_insert into the
     # cookie data using the character set of that cookie, replaces that specific cookie mutated with rest unchanged.
@@ -93,9 +98,10 @@ class TestLogic(Transform):
 def queueRequests(target, wordlists):
     engine = RequestEngine(endpoint=target.endpoint, concurrentConnections=10, requestsPerConnection=50, pipeline=0)
 
+    # tests are generated ahead in a background thread while the engine sends them
     TestFactory = TestLogic(target.req, wordlists)
-    for test in TestFactory:
-        engine.queue(test, label=TestFactory.get_label())
+    for test, label in TestProducer(TestFactory):
+        engine.queue(test, label=label)
 
 @UniqueSize(1)
 def handleResponse(req, interesting):
@@ -1,18 +1,29 @@
 # Helper Classes
 from .transforms import Transform
+from .transforms import RadamsaEngine
+from .transforms import TestProducer
 
 # Helper Class Decorators
 from .transforms import CloneTransform
 
 # Helper Class Method Decorators
 from .transforms import ApplyIteration
+from .transforms import ApplyBatch
+from .transforms import ApplyAdaptive
 from .transforms import ApplyRange
 from .transforms import ApplyList
 from .transforms import ApplyFilelist
 from .transforms import ApplyPayloads
 from .transforms import ApplyObserved
+from .transforms import Deterministic
 
 # Helper functions
 from .transforms import radamsa
+from .transforms import set_radamsa_engine
+from .transforms import set_template_cache_size
+from .transforms import set_memo_size
 from .transforms import random_insert
-from .transforms import index_insert
\ No newline at end of file
+from .transforms import index_insert
+from .transforms import random_insert_batch
+from .transforms import index_insert_batch
+from .transforms import get_random
\ No newline at end of file
@@ -0,0 +1,201 @@
+# Project: Haptyc
+# Author: Evan Custodio (@defparam)
+#
+# Copyright 2021 Evan Custodio
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# asyncio support of Transform.aiter(), this module needs python 3 and is only imported
+# when a transform is iterated with async for.
+#
+# The iterative transforms of a test are called in order like for the sync iterator, a
+# transform which is an async function (or returns an awaitable) gets its output awaited
+# when the test is generated. Up to concurrency tests are generated at the same time and
+# returned in order. Async transforms run concurrently with the transforms of other
+# tests, they should call self.get_state() and self.me() before their first await.
+# Labels set by an async transform go to the test it was called for. self.stop() in an
+# async transform ends iteration.
+
+import asyncio
+import inspect
+import collections
+import contextvars
+
+from .transforms import output_bytes, _active
+
+# A task running an async transform has a label box ([label]) in its context which
+# collects the labels set by the transform
+label_var = contextvars.ContextVar("haptyc_label", default=None)
+
+# start the task of an awaitable and return it with its label box
+def labelled(output):
+    box = [None]
+    token = label_var.set(box)
+    try:
+        task = asyncio.ensure_future(output) # the task takes a copy of our context
+    finally:
+        label_var.reset(token)
+    return task, box
+
+# Run the persistent transforms of a test once all outputs of its async iterative
+# transforms are there and return the rendered test and its label. The label is the
+# label of the sync transforms unless an async transform called for this test (the
+# label boxes in new) set one.
+async def render(factory, parts, new, label, pipelines):
+    for i in range(len(parts)):
+        if isinstance(parts[i], asyncio.Future):
+            parts[i] = await parts[i]
+            if factory._binary:
+                parts[i] = output_bytes(parts[i])
+    for box in new:
+        if box[0] != None:
+            label = box[0]
+    box = [None]
+    label_var.set(box)
+    if pipelines == None:
+        pipelines = factory._dynamic_pipelines
+    for slot, current_data, chain in pipelines:
+        for name, func, state in chain:
+            factory._transform_context = name
+            factory._state = state
+            # other tasks run while this one awaits, async transforms use state.random
+            _active.random = state.random
+            current_data = func(current_data)
+            if inspect.isawaitable(current_data):
+                current_data = await current_data
+        if factory._binary:
+            current_data = output_bytes(current_data)
+        parts[slot] = current_data
+    if box[0] != None:
+        label = box[0]
+    if factory._binary:
+        return (b"".join(parts), label)
+    return ("".join(parts), label)
+
+# stop a task (or coroutine) whose result is not needed anymore
+def drop(output):
+    if inspect.iscoroutine(output):
+        output.close()
+    elif isinstance(output, asyncio.Future):
+        if not output.done():
+            output.cancel()
+        elif not output.cancelled():
+            output.exception() # retrieved so that asyncio does not report it
+
+# The async iterator of a transform, tests are rendered by tasks of which up to
+# concurrency are pending
+class AsyncTests(object):
+    def __init__(self, factory, concurrency=8, labels=False):
+        if concurrency < 1:
+            raise Exception("Concurrency must be at least 1")
+        self._factory = factory
+        self._concurrency = concurrency
+        self._labels = labels
+        self._pending = collections.deque() # tasks of the tests being rendered
+        self._inits = [] # awaitables returned by the init of async transforms
+        self._done = False
+        if factory._async != None:
+            factory._async.close()
+        factory._async = self
+        # the inits run by seek() before we existed are run again so that we can await them
+        if factory._seeked and (factory.count() != None):
+            factory.seek(factory._test_index)
+        iter(factory) # start with the first test unless positioned by seek()
+
+    # called by the transform with the result of every transform init
+    def init(self, output):
+        if inspect.isawaitable(output):
+            self._inits += [output]
+
+    # called by the transform for every set_label()
+    def set_label(self, label):
+        box = label_var.get()
+        if box != None:
+            box[0] = label
+
+    # drop the outputs of async transforms which were generated but will never be used,
+    # the tasks of scheduled tests are only dropped with tasks=True
+    def _discard(self, tasks=False):
+        for operation in self._factory._iterative_operations:
+            output = operation['cached']
+            if inspect.isawaitable(output) and (tasks or not isinstance(output, asyncio.Future)):
+                drop(output)
+                operation['cached'] = None
+
+    # call the iterative transforms of the next test and start the task which renders it
+    def _schedule(self):
+        factory = self._factory
+        parts = factory._next_parts()
+        # the output of an async transform becomes a task, an outer clusterbomb output is
+        # placed into many tests and a task can be awaited by all of them
+        new = []
+        for operation in factory._iterative_operations:
+            output = operation['cached']
+            if inspect.isawaitable(output) and not isinstance(output, asyncio.Future):
+                task, box = labelled(output)
+                operation['cached'] = task
+                for kept in (parts, factory._parts or []):
+                    for i in range(len(kept)):
+                        if kept[i] is output:
+                            kept[i] = task
+                new += [box]
+        self._pending.append(asyncio.ensure_future(render(factory, parts, new, factory._label, factory._render_pipelines)))
+
+    async def next(self):
+        while True:
+            test, label = await self._next()
+            dedupe = self._factory._dedupe
+            if (dedupe == None) or not dedupe.add(test):
+                break
+        self._factory._label = label
+        if self._labels:
+            return (test, label)
+        return test
+
+    # return the next rendered test and its label
+    async def _next(self):
+        while (not self._done) and (len(self._pending) < self._concurrency):
+            # an init has to complete before its transform is called again
+            while len(self._inits):
+                await self._inits.pop(0)
+            try:
+                self._schedule()
+            except StopIteration:
+                self._done = True
+                self._discard()
+        while len(self._inits):
+            await self._inits.pop(0)
+        if len(self._pending) == 0:
+            self.close()
+            raise StopAsyncIteration
+        task = self._pending.popleft()
+        try:
+            return await task
+        except RuntimeError as e:
+            # an async transform called self.stop()
+            if not isinstance(e.__cause__, StopIteration):
+                raise
+            self.close()
+            raise StopAsyncIteration
+
+    # cancel all pending tests, the next async for over the transform starts again
+    def close(self):
+        self._done = True
+        while len(self._pending):
+            drop(self._pending.popleft())
+        for output in self._inits:
+            drop(output)
+        self._inits = []
+        self._discard(tasks=True)
+        if self._factory._async is self:
+            self._factory._async = None
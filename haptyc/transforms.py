@@ -24,6 +24,37 @@ import copy
 import functools
 import types
 import glob
+import math
+import numbers
+import hashlib
+import re
+import tempfile
+import shutil
+import threading
+import collections
+import time
+import struct
+import inspect
+
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
+try: # multiprocessing is not available in a jython context
+    import multiprocessing
+except ImportError:
+    multiprocessing = None
+
+# the most precise clock for measuring durations
+clock = getattr(time, "perf_counter", time.time)
+
+try: # numpy is optional, the batch mutation helpers fall back to pure python
+    import numpy
+except ImportError:
+    numpy = None
+
+from .wordlists import LineStream, IndexedLines, open_index, count_elements
 
 global IS_JYTHYON
 global IS_BURP
@@ -57,50 +88,371 @@ def GetDataFromStream(stream):
             return line[0:-1]
         line += data + "\n"
 
+# Raw byte types, a python 2 string is raw bytes as well
+BINARY_TYPES = (bytes, bytearray, memoryview)
+
+# Convert raw bytes to a string with every byte becoming the character of the same
+# code point (latin-1), str_to_bytes is its inverse. Both are no-ops on python 2 strings.
 def bytes_to_str(data):
-    return "".join([chr(ord(i)) for i in data])
+    if isinstance(data, memoryview):
+        data = data.tobytes()
+    if isinstance(data, str):
+        return data
+    if str is bytes: # python 2 bytearray or unicode
+        if isinstance(data, bytearray):
+            return str(data)
+        return data.encode("latin-1")
+    return bytes(data).decode("latin-1")
     
 def str_to_bytes(data):
-    return b"".join([chr(ord(i)) for i in data])
+    if isinstance(data, bytes):
+        return data
+    if isinstance(data, memoryview):
+        return data.tobytes()
+    if isinstance(data, bytearray):
+        return bytes(data)
+    return data.encode("latin-1")
+
+# String types, the unicode strings of python 2 included
+TEXT_TYPES = (str, type(u""))
+
+# convert the output of a transform of a raw bytes request to bytes, text which can't
+# be represented in latin-1 (e.g. from a wordlist) is utf-8 encoded
+def output_bytes(data):
+    if isinstance(data, bytes):
+        return data
+    if not isinstance(data, TEXT_TYPES + BINARY_TYPES): # e.g. the pending output of an async transform
+        return data
+    try:
+        return str_to_bytes(data)
+    except UnicodeError:
+        return data.encode("utf-8")
+
+# Haptyc tags are [+name], [#name], [%name] and [@name] each closed with its end tag
+# ([+end], [#end], [%end] and [@end]), the tag character selects the transformer type
+TAG_PATTERN = re.compile(r"\[([+#%@])([^\[\]]*)\]")
+TAG_TYPES = {"+": 0, "#": 1, "%": 2, "@": -1}
+
+# derive a random seed from a campaign seed and the parts which identify a random stream
+def derive_seed(*parts):
+    key = ":".join([str(part) for part in parts])
+    return int(hashlib.md5(key.encode("utf-8")).hexdigest(), 16)
+
+# Every operation of a transform has its own random stream (state.random), with a campaign
+# seed it is seeded from the seed, the operation and the test. The stream of the operation
+# which is running in a thread is the stream of the random helpers below.
+_active = threading.local()
+
+# return the random stream of the running operation, outside of a transform the global
+# random module
+def get_random():
+    return getattr(_active, "random", None) or random
 
 # We use this helper function to generate a high entropy random string for
 # text replacement
-def get_random_string(length):
-    result_str = ''.join(random.choice(string.ascii_letters) for i in range(length))
+def get_random_string(length, rng=None):
+    rng = rng or get_random()
+    result_str = ''.join(rng.choice(string.ascii_letters) for i in range(length))
     return result_str
     
+# Iterative logic decorators describe the number of tests they generate by attaching
+# a haptyc_count(self) function to the transform, it returns None when unknown
+def set_count(func, count):
+    func.haptyc_count = count
+    return func
+
+# Iterative logic decorators which can address any of their tests attach a
+# haptyc_seek(self, state, index) function which positions an initialized state
+# so that the next call of the transform generates test number index
+def set_seek(func, seek):
+    func.haptyc_seek = seek
+    return func
+
+# Transforms marked with the Deterministic decorator always generate the same output for the
+# same data and position, they are not random and do not depend on other transforms
+def set_deterministic(func):
+    func.haptyc_deterministic = True
+    return func
+
+# The state record of a transform, it is created once for every operation and passed
+# to the transform on every call. The attributes used by the logic decorators have slots,
+# transforms can add any attribute of their own.
+class TransformState(object):
+    __slots__ = ("init", "iter", "index", "limit", "curr", "end", "step", "elements",
+                 "lines", "stream", "batch", "size", "random", "__dict__")
+
+    # return the (name, value) pairs of all attributes that are set
+    def items(self):
+        items = []
+        for name in TransformState.__slots__[:-1]:
+            if hasattr(self, name):
+                items += [(name, getattr(self, name))]
+        return items + list(self.__dict__.items())
+
+    # return a copy of the state for a single call: the attributes of the logic decorators
+    # keep their values of the call, attributes of the transform are shared
+    def snapshot(self):
+        state = TransformState()
+        for name in TransformState.__slots__[:-1]:
+            if hasattr(self, name):
+                setattr(state, name, getattr(self, name))
+        state.__dict__ = self.__dict__
+        return state
+
+# The body of an async transform only runs once its task runs, after the logic decorator
+# moved the state on to the next call. The transform gets a snapshot of the state instead.
+def snapshot_calls(func):
+    iscoroutinefunction = getattr(inspect, "iscoroutinefunction", None)
+    if (iscoroutinefunction == None) or not iscoroutinefunction(func):
+        return func
+    @functools.wraps(func)
+    def call(self, data, state):
+        if state.init:
+            return func(self, data, state)
+        return func(self, data, state.snapshot())
+    return call
+
+# seek function of logic decorators which iterate over state.elements
+def seek_elements(self, state, index):
+    state.index = index
+    state.iter = index
+
 def get_transform_type(funcname):
     if ((len(funcname) >= 6) and (funcname[0:5] == "test_")):
         return 0
     elif ((len(funcname) >= 5) and (funcname[0:4] == "per_")):
         return -1
 
-def radamsa(data):
-    if is_win():
-        stdout, stderr = subprocess.Popen(["wsl","radamsa", "-"], stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE).communicate(str_to_bytes(data))
-    else:
-        stdout, stderr = subprocess.Popen(["radamsa", "-"], stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE).communicate(str_to_bytes(data))
+# translate a windows path into its mount point inside of wsl
+def wsl_path(path):
+    drive, rest = os.path.splitdrive(os.path.abspath(path))
+    return "/mnt/" + drive[0:1].lower() + rest.replace("\\", "/")
+
+def radamsa_fixup(data, binary=False):
     # Bug: we have to do this replace of %s because turbo intruder scans for %s replacements
     # there is no way to turn this off in turbo intruder without recompiling it
-    return bytes_to_str(stdout).replace(r"%s",r"%x")
+    if binary:
+        return data.replace(b"%s",b"%x")
+    return bytes_to_str(data).replace(r"%s",r"%x")
+
+# Run radamsa once and return a list of count mutations of data. For more than one
+# mutation we use radamsa's batch mode which writes every mutation to its own file.
+# Mutations of raw bytes input are returned as bytes, otherwise as strings.
+def radamsa_spawn(data, count=1, seed=None):
+    binary = isinstance(data, BINARY_TYPES)
+    cmd = ["radamsa"]
+    if is_win():
+        cmd = ["wsl","radamsa"]
+    if seed != None:
+        cmd += ["-s", str(seed)]
+    if count == 1:
+        stdout, stderr = subprocess.Popen(cmd + ["-"], stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE).communicate(str_to_bytes(data))
+        return [radamsa_fixup(stdout, binary)]
+    outdir = tempfile.mkdtemp(prefix="haptyc")
+    try:
+        if is_win():
+            pattern = wsl_path(outdir) + "/%n"
+        else:
+            pattern = os.path.join(outdir, "%n")
+        subprocess.Popen(cmd + ["-n", str(count), "-o", pattern, "-"], stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE).communicate(str_to_bytes(data))
+        mutations = []
+        # radamsa numbers its outputs starting at 1
+        for i in range(1, count+1):
+            path = os.path.join(outdir, str(i))
+            if not os.path.exists(path):
+                continue
+            with open(path, "rb") as f:
+                mutations += [radamsa_fixup(f.read(), binary)]
+        if len(mutations) == 0:
+            raise Exception("radamsa did not produce any mutations (is radamsa installed?)")
+        return mutations
+    finally:
+        shutil.rmtree(outdir, True)
+
+# The pre-generated mutations of an input and the error of its last failed refill
+class MutationQueue(collections.deque):
+    error = None
+
+# Spawning radamsa for every mutation makes process creation the dominant cost of a
+# campaign. The first request of an input is served by a single mutation, inputs which
+# are requested again get a queue of pre-generated mutations and a set of long lived
+# worker threads refill a queue with a new batch (a single radamsa spawn) once it
+# drops below half of the batch size
+class RadamsaEngine(object):
+    def __init__(self, batch=100, workers=2, samples=32):
+        self.batch = batch # number of mutations generated per radamsa spawn
+        self.samples = samples # number of distinct inputs to keep queues for
+        self.spawns = 0 # number of radamsa spawns
+        self.spawn_time = 0.0 # seconds spent in radamsa spawns
+        self.wait_time = 0.0 # seconds mutate() waited for a mutation
+        self._queues = collections.OrderedDict() # input -> queue of mutations
+        self._pending = {} # input -> queue that is currently being refilled
+        self._cond = threading.Condition()
+        self._jobs = queue.Queue()
+        self._workers = []
+        for i in range(workers):
+            worker = threading.Thread(target=self._work)
+            worker.daemon = True
+            worker.start()
+            self._workers += [worker]
+
+    def _generate(self, data, count):
+        start = clock()
+        mutations = radamsa_spawn(data, count, random.randint(0, 2**31))
+        with self._cond:
+            self.spawns += 1
+            self.spawn_time += clock() - start
+        return mutations
+
+    def _work(self):
+        while True:
+            data = self._jobs.get()
+            if data == None:
+                return
+            try:
+                generated = self._generate(data, self.batch)
+                error = None
+            except Exception as e:
+                generated = []
+                error = e
+            with self._cond:
+                mutations = self._pending.pop(data)
+                mutations.extend(generated)
+                mutations.error = error
+                self._cond.notify_all()
+
+    # return the next mutation of data
+    def mutate(self, data):
+        if isinstance(data, (bytearray, memoryview)):
+            data = str_to_bytes(data)
+        with self._cond:
+            # move this input to the most recently used position evicting the
+            # least recently used inputs if we are over capacity
+            mutations = self._queues.pop(data, None)
+            cold = (mutations == None) and (data not in self._pending)
+            if mutations == None:
+                mutations = self._pending.get(data, MutationQueue())
+                while len(self._queues) >= self.samples:
+                    self._queues.popitem(last=False)
+            self._queues[data] = mutations
+
+            if not cold:
+                return self._next(data, mutations)
+
+        # an input seen for the first time may never be requested again, serve it with
+        # a single mutation and only refill it with batches once it is requested again
+        start = clock()
+        mutation = self._generate(data, 1)[0]
+        with self._cond:
+            self.wait_time += clock() - start
+        return mutation
+
+    # return the next mutation out of the queue of a (locked) input
+    def _next(self, data, mutations):
+        if len(self._workers) == 0:
+            if len(mutations) == 0:
+                mutations.extend(self._generate(data, self.batch))
+            return mutations.popleft()
+
+        # schedule a refill when we hit the low watermark
+        if (len(mutations) <= self.batch // 2) and (data not in self._pending):
+            self._refill(data, mutations)
+
+        start = clock()
+        while len(mutations) == 0:
+            # the refill of this input is done, every waiter raises its error and the
+            # next request of the input schedules a new refill
+            if data not in self._pending:
+                if mutations.error != None:
+                    raise mutations.error
+                self._refill(data, mutations)
+            self._cond.wait()
+        self.wait_time += clock() - start
+        return mutations.popleft()
+
+    # schedule a refill of the (locked) queue of an input
+    def _refill(self, data, mutations):
+        mutations.error = None
+        self._pending[data] = mutations
+        self._jobs.put(data)
 
-def random_insert(data, chars):
+    # stop all worker threads once they finish their current batch
+    def close(self):
+        for worker in self._workers:
+            self._jobs.put(None)
+        for worker in self._workers:
+            worker.join()
+        self._workers = []
+
+_radamsa_engine = None
+
+# replace the engine used by radamsa(), passing None restores the default engine
+def set_radamsa_engine(engine):
+    global _radamsa_engine
+    _radamsa_engine = engine
+
+def radamsa(data):
+    global _radamsa_engine
+    if _radamsa_engine == None:
+        _radamsa_engine = RadamsaEngine()
+    return _radamsa_engine.mutate(data)
+
+# insert char into data at index by slicing, strings inserted into raw bytes are
+# converted with latin-1 and raw bytes inserted into a string the other way around
+def insert_at(data, char, index):
+    if isinstance(data, memoryview):
+        data = data.tobytes()
+    if isinstance(data, (bytes, bytearray)):
+        if not isinstance(char, BINARY_TYPES):
+            char = str_to_bytes(char)
+    elif isinstance(char, BINARY_TYPES):
+        char = bytes_to_str(char)
+    return data[:index] + char + data[index:]
+
+def random_insert(data, chars, rng=None):
     if type(chars) != list:
         raise Exception("Second argument must be a list of strings")
-    char = random.choice(chars)
-    data = list(data)
-    data.insert(random.randint(0,len(data)), char)
-    return ''.join(data)
+    rng = rng or get_random()
+    char = rng.choice(chars)
+    return insert_at(data, char, rng.randint(0,len(data)))
     
-def index_insert(data, chars, index):
+def index_insert(data, chars, index, rng=None):
     if type(chars) != list:
         raise Exception("Second argument must be a list of strings")
     if ((index < 0) or (index > len(data))):
         raise StopIteration
-    char = random.choice(chars)
-    data = list(data)
-    data.insert(index, char)
-    return ''.join(data)
+    char = (rng or get_random()).choice(chars)
+    return insert_at(data, char, index)
+
+# Return count random integers in [0, n). With numpy they are generated in one call by
+# a generator which is seeded from the random stream so that a campaign seed still applies
+def random_indexes(n, count, rng=None):
+    rng = rng or get_random()
+    if numpy != None:
+        return numpy.random.RandomState(rng.getrandbits(32)).randint(0, n, count).tolist()
+    rand = rng.random
+    return [int(rand() * n) for i in range(count)]
+
+# return count mutations of data, each with a payload from the list inserted at a random index
+def random_insert_batch(data, chars, count, rng=None):
+    if type(chars) != list:
+        raise Exception("Second argument must be a list of strings")
+    if isinstance(data, memoryview):
+        data = data.tobytes()
+    choices = random_indexes(len(chars), count, rng)
+    indexes = random_indexes(len(data) + 1, count, rng)
+    return [insert_at(data, chars[choices[i]], indexes[i]) for i in range(count)]
+
+# return count mutations of data, each with a random payload from the list inserted at index
+def index_insert_batch(data, chars, index, count, rng=None):
+    if type(chars) != list:
+        raise Exception("Second argument must be a list of strings")
+    if ((index < 0) or (index > len(data))):
+        raise StopIteration
+    if isinstance(data, memoryview):
+        data = data.tobytes()
+    head, tail = data[:index], data[index:]
+    return [insert_at(head, chars[i], len(head)) + tail for i in random_indexes(len(chars), count, rng)]
 
 def CloneTransform(src, dest):
     def decorator(orig):
@@ -110,9 +462,9 @@ def CloneTransform(src, dest):
         def __init__(self, *args, **kws):
             # this is our copy func, we explicitly make copies of all of the function parts that we use
             def copy_func(f, fname=None, fclosure=None):
-                g = types.FunctionType(f.func_code, f.func_globals, fname or f.func_name,
-                                       f.func_defaults,
-                                       fclosure or f.func_closure)
+                g = types.FunctionType(f.__code__, f.__globals__, fname or f.__name__,
+                                       f.__defaults__,
+                                       fclosure or f.__closure__)
                 g.__dict__.update(f.__dict__)
                 g = functools.update_wrapper(g, f)
                 return g
@@ -126,22 +478,22 @@ def CloneTransform(src, dest):
             src_func = getattr(self, src)
             
             # lets take care of closures if they exist
-            if src_func.func_closure != None:
+            if src_func.__closure__ != None:
                 newclo = ()
-                for cell in src_func.func_closure:
-                    if callable(cell.cell_contents) and (cell.cell_contents.func_name == src):
+                for cell in src_func.__closure__:
+                    if callable(cell.cell_contents) and (cell.cell_contents.__name__ == src):
                         # create a copy of the source closure cell func
                         newfunc = copy_func(cell.cell_contents,dest)
-                        # now that everything has been cloned, rename the destination func_name with the new name
-                        newfunc.func_name = dest
+                        # now that everything has been cloned, rename the destination function name with the new name
+                        newfunc.__name__ = dest
                         newclo += (build_cell(newfunc),)
                     else:
                         newclo += (cell,)
-                tmpfunc = types.MethodType(copy_func(src_func,src_func.func_name,newclo),self)
+                tmpfunc = types.MethodType(copy_func(src_func,src_func.__name__,newclo),self)
             else:
                 # we make a copy of the function with its own closure object and assign it to
                 newfunc = copy_func(src_func,dest)
-                newfunc.func_name = dest
+                newfunc.__name__ = dest
                 tmpfunc = types.MethodType(newfunc,self)
                 
             
@@ -158,9 +510,483 @@ def CloneTransform(src, dest):
     return decorator
 
 
+# The transform being generated by parallel_iter, worker processes inherit it when forked
+_parallel_factory = None
+
+# generate the tests [start, end) of the forked transform as (test, label) tuples
+def _parallel_chunk(chunk):
+    start, end = chunk
+    factory = _parallel_factory
+    factory.seek(start)
+    factory._shard_end = end
+    factory._dedupe = None # repeats are skipped across chunks by the parent
+    if factory._seed == None:
+        # forked workers inherit the random streams, every chunk gets streams of its own
+        system = random.SystemRandom()
+        for state in factory._bound_states():
+            state.random.seed(system.getrandbits(64))
+    tests = []
+    for test in factory:
+        tests += [(test, factory.get_label())]
+    return tests
+
+# State attributes which hold data owned by the logic decorators, init builds them again
+# on restore so they are not part of a checkpoint
+CHECKPOINT_SKIP = ("init", "elements", "lines", "stream", "random")
+
+# convert a value to its json representation, returns None if it can't be represented
+def checkpoint_value(value):
+    if (value == None) or isinstance(value, (bool, numbers.Number)):
+        return [value]
+    if isinstance(value, TEXT_TYPES):
+        if isinstance(value, bytes): # raw strings in python 2
+            return [value.decode("latin-1")]
+        return [value]
+    if isinstance(value, BINARY_TYPES):
+        return [bytes_to_str(value)]
+    if isinstance(value, (list, tuple, collections.deque)):
+        out = []
+        for item in value:
+            item = checkpoint_value(item)
+            if item == None:
+                return None
+            out += item
+        return [out]
+    return None
+
+# convert a json value from a checkpoint back, strings become raw strings in python 2
+def restore_value(value):
+    if isinstance(value, list):
+        return [restore_value(item) for item in value]
+    if (str is bytes) and isinstance(value, type(u"")):
+        try:
+            return value.encode("latin-1")
+        except UnicodeError:
+            return value
+    return value
+
+# Generates the tests of a transform in background threads into a bounded queue so that
+# test generation runs ahead of the request engine but never more than depth tests.
+# A producer which finds the queue full waits until the engine drained it down to the
+# low watermark, a consumer which finds it empty waits for the producers. With more
+# than one worker every worker generates a shard of the tests with its own copy of the
+# transform (built with the same request, wordlists and seed), the tests are then not
+# in test order. Iterating over the producer returns (test, label) tuples.
+class TestProducer(object):
+    def __init__(self, factory, depth=10000, low=None, workers=1, chunk=64):
+        if (depth < 1) or (workers < 1):
+            raise Exception("TestProducer needs a depth and workers of at least 1")
+        self.depth = depth # maximum number of queued tests
+        self.low = low # low watermark
+        if self.low == None:
+            self.low = depth // 2
+        self.chunk = min(chunk, depth) # number of tests generated between queue updates
+        self.generated = 0
+        self.consumed = 0
+        self.starved = 0 # number of times the consumer had to wait for tests
+        self.blocked = 0 # number of times a producer had to wait for the consumer
+        self._queue = collections.deque()
+        self._cond = threading.Condition()
+        self._error = None
+        self._closed = False
+        self._consumer_waiting = False
+        self._producers_waiting = 0
+        self._last = (time.time(), 0, 0) # time, generated and consumed of the last stats()
+
+        factories = [factory]
+        if workers > 1:
+            if factory._shard != None:
+                raise Exception("TestProducer workers can't split a sharded transform")
+            factories = []
+            for k in range(workers):
+                copy = factory.__class__(factory._data, factory._wordlists, shard=(k, workers), seed=factory._seed)
+                copy._randomize_lists = factory._randomize_lists
+                copy._seed_random = factory._seed_random
+                if factory._dedupe != None: # every worker skips the repeats of its shard
+                    copy.dedupe(True, factory._dedupe.exact, factory._dedupe.capacity, factory._dedupe.error_rate)
+                factories += [copy]
+        self._running = len(factories)
+        self._threads = []
+        for copy in factories:
+            thread = threading.Thread(target=self._produce, args=(copy,))
+            thread.daemon = True
+            thread.start()
+            self._threads += [thread]
+
+    def _produce(self, factory):
+        try:
+            iter(factory)
+            while True:
+                # generate a chunk of tests outside of the lock, iterating over the transform
+                # again would start it over so its next() is called directly
+                items = []
+                try:
+                    while len(items) < self.chunk:
+                        test = factory.next()
+                        items += [(test, factory.get_label())]
+                except StopIteration:
+                    pass
+                with self._cond:
+                    if len(self._queue) + len(items) > self.depth:
+                        self.blocked += 1
+                        self._producers_waiting += 1
+                        while (len(self._queue) > min(self.low, self.depth - len(items))) and not self._closed:
+                            self._cond.wait()
+                        self._producers_waiting -= 1
+                    if self._closed:
+                        return
+                    self._queue.extend(items)
+                    self.generated += len(items)
+                    if self._consumer_waiting:
+                        self._cond.notify_all()
+                if len(items) < self.chunk:
+                    return
+        except Exception as e:
+            with self._cond:
+                self._error = e
+        finally:
+            with self._cond:
+                self._running -= 1
+                self._cond.notify_all()
+
+    def __iter__(self):
+        return self
+
+    # return the next (test, label) tuple, waits for the producers if the queue is empty
+    def next(self):
+        with self._cond:
+            if len(self._queue) == 0:
+                self.starved += 1
+                while len(self._queue) == 0:
+                    if self._error != None:
+                        # stop the other producers
+                        error = self._error
+                        self._error = None
+                        self._closed = True
+                        self._cond.notify_all()
+                        raise error
+                    if (self._running == 0) or self._closed:
+                        raise StopIteration
+                    self._consumer_waiting = True
+                    self._cond.wait()
+                    self._consumer_waiting = False
+            item = self._queue.popleft()
+            self.consumed += 1
+            if self._producers_waiting and (len(self._queue) <= self.low):
+                self._cond.notify_all()
+            return item
+    __next__ = next
+
+    # Return the queue depth, the counters and the generation and consumer rates in tests
+    # per second since the last call of stats() (or since the producer was started)
+    def stats(self):
+        with self._cond:
+            now = time.time()
+            last, generated, consumed = self._last
+            elapsed = max(now - last, 1e-6)
+            self._last = (now, self.generated, self.consumed)
+            return {
+                "depth": len(self._queue),
+                "capacity": self.depth,
+                "generated": self.generated,
+                "consumed": self.consumed,
+                "generation_rate": (self.generated - generated) / elapsed,
+                "consumer_rate": (self.consumed - consumed) / elapsed,
+                "starved": self.starved,
+                "blocked": self.blocked,
+                "producers": self._running,
+            }
+
+    # stop the producers, they finish the chunk of tests they are generating, and drop
+    # all queued tests
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._queue.clear()
+            self._cond.notify_all()
+        for thread in self._threads:
+            if thread is not threading.current_thread():
+                thread.join()
+
+# Remembers the generated tests so that repeated tests can be skipped. Tests are hashed
+# (md5) into an exact set until there are more than exact of them, then the filter
+# switches to a Bloom filter sized for capacity tests which never grows. A Bloom filter
+# skips a new test as a repeat with a probability of error_rate (at capacity tests).
+class TestFilter(object):
+    def __init__(self, exact=100000, capacity=10000000, error_rate=0.001):
+        self.exact = exact
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self._lock = threading.Lock()
+        self.clear()
+
+    # forget all tests
+    def clear(self):
+        with self._lock:
+            self.tests = 0
+            self.duplicates = 0
+            self._digests = set()
+            self._bits = None
+
+    # switch to a Bloom filter with the bits and hash count for capacity and error_rate
+    def _bloom(self):
+        self._size = int(math.ceil(-self.capacity * math.log(self.error_rate) / (math.log(2) ** 2)))
+        self._hashes = max(1, int(round(self._size / float(self.capacity) * math.log(2))))
+        self._bits = bytearray((self._size + 7) // 8)
+        for digest in self._digests:
+            self._bloom_add(digest)
+        self._digests = None
+
+    # set the bits of a digest and return True if all of them were set already
+    def _bloom_add(self, digest):
+        h1, h2 = struct.unpack("<QQ", digest)
+        h2 |= 1
+        seen = True
+        for i in range(self._hashes):
+            bit = (h1 + i * h2) % self._size
+            if not (self._bits[bit >> 3] & (1 << (bit & 7))):
+                seen = False
+                self._bits[bit >> 3] |= (1 << (bit & 7))
+        return seen
+
+    # add a test and return True if it was seen before
+    def add(self, test):
+        if not isinstance(test, bytes):
+            test = test.encode("utf-8")
+        digest = hashlib.md5(test).digest()
+        with self._lock:
+            self.tests += 1
+            if self._bits == None:
+                seen = digest in self._digests
+                if not seen:
+                    self._digests.add(digest)
+                    if len(self._digests) > self.exact:
+                        self._bloom()
+            else:
+                seen = self._bloom_add(digest)
+            if seen:
+                self.duplicates += 1
+            return seen
+
+    def stats(self):
+        with self._lock:
+            return {
+                "tests": self.tests,
+                "duplicates": self.duplicates,
+                "hit_rate": self.duplicates / float(max(self.tests, 1)),
+                "mode": "exact" if self._bits == None else "bloom",
+            }
+
+# Records the wall time, call count and output bytes of every transform function of a
+# transform and the time spent in haptyc itself (rendering, dedupe, ...) while tests are
+# generated. Async transforms are timed until they return their awaitable.
+class Profiler(object):
+    def __init__(self, report="table", file=None):
+        self.report_format = report # format of the report written at the end of iteration
+        self.file = file # file object for the report, standard output by default
+        self.records = collections.OrderedDict() # name -> [calls, seconds, output bytes]
+        self.tests = 0
+        self.test_bytes = 0
+        self.seconds = 0.0 # time spent generating tests
+        self.transform_seconds = 0.0 # time spent in transform functions (their inits included)
+        self.haptyc_seconds = 0.0 # time spent generating tests outside of transform functions
+        self._radamsa = self._radamsa_counters()
+
+    def _radamsa_counters(self):
+        if _radamsa_engine == None:
+            return (0, 0.0, 0.0)
+        return (_radamsa_engine.spawns, _radamsa_engine.spawn_time, _radamsa_engine.wait_time)
+
+    # return func wrapped so that its calls are recorded under name
+    def wrap(self, name, func):
+        if name not in self.records:
+            self.records[name] = [0, 0.0, 0]
+        record = self.records[name]
+        def timed(*args):
+            start = clock()
+            try:
+                output = func(*args)
+            finally:
+                elapsed = clock() - start
+                record[0] += 1
+                record[1] += elapsed
+                self.transform_seconds += elapsed
+            if isinstance(output, TEXT_TYPES + BINARY_TYPES):
+                record[2] += len(output)
+            return output
+        return timed
+
+    # generate the next test of factory and record it, writes the report at the end. The
+    # last call is accounted before the report as it can do a lot of work (e.g. skip tests).
+    def next(self, factory):
+        start = clock()
+        transform_seconds = self.transform_seconds
+        try:
+            try:
+                test = factory._next()
+            finally:
+                elapsed = clock() - start
+                self.seconds += elapsed
+                self.haptyc_seconds += elapsed - (self.transform_seconds - transform_seconds)
+        except StopIteration:
+            if self.report_format != None:
+                file = self.file or sys.stdout
+                file.write(self.report(self.report_format) + "\n")
+                file.flush()
+            raise
+        self.tests += 1
+        self.test_bytes += len(test)
+        return test
+
+    # return the recorded numbers as a table or as a json string
+    def report(self, format="table"):
+        spawns, spawn_time, wait_time = self._radamsa_counters()
+        radamsa = {
+            "spawns": spawns - self._radamsa[0],
+            "spawn_seconds": spawn_time - self._radamsa[1],
+            "wait_seconds": wait_time - self._radamsa[2],
+        }
+        haptyc_seconds = self.haptyc_seconds
+        if format == "json":
+            return json.dumps({
+                "tests": self.tests,
+                "test_bytes": self.test_bytes,
+                "seconds": self.seconds,
+                "haptyc_seconds": haptyc_seconds,
+                "transforms": dict([(name, {"calls": record[0], "seconds": record[1], "bytes": record[2]})
+                                    for name, record in self.records.items()]),
+                "radamsa": radamsa,
+            })
+        total = max(self.seconds, 1e-9)
+        lines = ["Haptyc profile: %d tests (%d bytes) in %.3fs, %.0f tests/s"%(self.tests, self.test_bytes, self.seconds, self.tests / total)]
+        lines += ["%-24s %10s %10s %12s %14s %7s"%("transform", "calls", "seconds", "us/call", "output bytes", "share")]
+        rows = [(name, record[0], record[1], record[2]) for name, record in self.records.items()]
+        rows += [("(haptyc)", self.tests, haptyc_seconds, self.test_bytes)]
+        for name, calls, seconds, size in rows:
+            lines += ["%-24s %10d %10.3f %12.1f %14d %6.1f%%"%(name, calls, seconds, seconds * 1e6 / max(calls, 1), size, seconds * 100 / total)]
+        if radamsa["spawns"]:
+            lines += ["radamsa: %d spawns taking %.3fs in the engine workers, transforms waited %.3fs for mutations"%(radamsa["spawns"], radamsa["spawn_seconds"], radamsa["wait_seconds"])]
+        return "\n".join(lines)
+
+# A bounded least recently used cache
+class LRUCache(object):
+    def __init__(self, size):
+        self.size = size
+        self._items = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._items.pop(key, None)
+            if value != None:
+                self._items[key] = value
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._items.pop(key, None)
+            self._items[key] = value
+            while len(self._items) > self.size:
+                self._items.popitem(last=False)
+
+    def resize(self, size):
+        with self._lock:
+            self.size = size
+            while len(self._items) > self.size:
+                self._items.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+    def __len__(self):
+        return len(self._items)
+
+# Compiled templates keyed by (Transform subclass, request). Building many factories for
+# the same request (e.g. once per host) skips transformer discovery and tag parsing.
+_template_cache = LRUCache(64)
+
+# set the number of compiled templates to keep, 0 disables the cache
+def set_template_cache_size(size):
+    _template_cache.resize(size)
+
+# The outputs of an operation of a deterministic transform (and the label each output set)
+# by the position of the output. They are recorded during the first sweep of the operation
+# after its init, later clusterbomb sweeps replay them without calling the transform.
+class OperationMemo(object):
+    def __init__(self):
+        self.outputs = [] # (output, label)
+        self.complete = False
+
+# Number of outputs the memos of a transform may hold, dimensions are memoized from the
+# smallest up while they fit
+_memo_size = 100000
+
+# set the number of outputs of deterministic transforms to keep, 0 disables memoization
+def set_memo_size(size):
+    global _memo_size
+    _memo_size = size
+
+# Response classes are the status code with the length and time of a response in
+# logarithmic buckets (every bucket is ~40% wider than the one before it)
+def response_class(status=None, length=None, time=None):
+    if (status == None) and (length == None) and (time == None):
+        return None
+    def bucket(value):
+        if value == None:
+            return None
+        return int(math.log(max(value, 0) + 1, 2) * 2)
+    return (status, bucket(length), bucket(time))
+
+# The corpus of an @ApplyAdaptive transform holds the payloads which are mutated, each
+# with an energy which is its weight when a payload is picked. A mutation whose test got
+# a response of a class which was not seen before (or a positive score) joins the corpus
+# and doubles the energy of its parent, payloads without new responses slowly lose energy.
+# Feedback arrives from the response threads so the corpus is locked.
+class AdaptiveCorpus(object):
+    def __init__(self, data, size=256):
+        self.size = size # maximum number of payloads
+        self.seeds = [[data, 1.0]] # [payload, energy], the inner data always stays
+        self.classes = set() # response classes seen so far
+        self.finds = 0 # number of payloads added for new responses
+        self._lock = threading.Lock()
+
+    # pick a payload to mutate, weighted by energy
+    def choose(self):
+        with self._lock:
+            pick = get_random().random() * sum([seed[1] for seed in self.seeds])
+            for seed in self.seeds:
+                pick -= seed[1]
+                if pick < 0:
+                    return seed
+            return self.seeds[-1]
+
+    # take the response class and score of a test which mutated seed into payload
+    def feedback(self, seed, payload, cls, score):
+        with self._lock:
+            new = (cls != None) and (cls not in self.classes)
+            if new:
+                self.classes.add(cls)
+            if new or ((score != None) and (score > 0)):
+                self.finds += 1
+                seed[1] = min(seed[1] * 2 + (score or 0), 1000.0)
+                self.seeds += [[payload, 1.0 + (score or 0)]]
+                if len(self.seeds) > self.size:
+                    # drop the payload with the least energy
+                    weakest = min(range(1, len(self.seeds)), key=lambda i: self.seeds[i][1])
+                    del self.seeds[weakest]
+            else:
+                seed[1] = max(seed[1] * 0.95, 0.05)
+
 # This is our base transform class, all derivative transforms must inherit from it
 class Transform():
-    def __init__(self, req, wordlists=None):
+    def __init__(self, req, wordlists=None, shard=None, seed=None):
+        # A request given as raw bytes (bytes, bytearray or memoryview) is rendered as
+        # bytes, transforms get and return bytes so binary bodies are never decoded
+        self._binary = isinstance(req, BINARY_TYPES) and not isinstance(req, str)
+        if self._binary:
+            req = str_to_bytes(req)
+
         # We initialize the class with instance specific variables
         self._data = req # This is the input raw data
         self._wordlists = wordlists # turbo intruder wordlists
@@ -175,18 +1001,75 @@ class Transform():
         self._trans_types = ["Sniper", "Battering Ram/Pitchfork", "Clusterbomb"]
         self._iterative_mode = False
         self._randomize_lists = False
+        self._seed_random = False # seed the random module too, see seed_random()
         self._label  = ""
-        self._gstate = {}
-
-        # parse all attributes of this class looking for iterative and persistent transformers
-        for item in dir(self):
-            if ((len(item) >= 6) and (item[0:5] == "test_")):
-                self._iterative_transformers += [item[5:]]
-            elif ((len(item) >= 5) and (item[0:4] == "per_")):
-                self._persistent_transformers += [item[4:]]
-                
-        # With all transformers identfied, now parse the tagged data
-        self._parse()
+        self._state = None # state of the currently running transform
+        self._async = None # asyncio iteration, see aiter()
+        self._dedupe = None # TestFilter of the generated tests, see dedupe()
+        self._profiler = None # Profiler of test generation, see profile()
+        self._feedback_pending = [] # (corpus, seed, payload) of adaptive outputs of the current test
+        self._feedback_tests = LRUCache(65536) # test index -> (corpus, seed, payload) list
+        self._feedback_labels = LRUCache(65536) # label -> test index
+        self._calls = None # (name, function, state) of every iterative operation by position
+        self._pipelines = None # (slot, data, [(name, function, state)]) of every persistent operation
+        self._dynamic_pipelines = None # the pipelines evaluated for every test, see _fold_pipelines()
+        self._frames = None # (parts, slot, pipelines) of every sniper operation, see _build_frames()
+        self._frame = None # position of the sniper operation the other operations were reset for
+        self._render_pipelines = None # persistent operations of the parts of the current test
+        self._parts = None # clusterbomb segment list with the current output of every operation
+        self._memos = None # OperationMemo of every iterative operation by position, None if not memoized
+        self._segments = [] # compiled request: literal text and transform slots
+        self._test_index = 0 # index of the next test to generate
+        self._seeked = False # iteration was positioned by seek()
+        self._exhausted = False
+        self._seed = seed # campaign seed for reproducible random choices
+        self._shard = None # (k, n): only generate the k-th of n disjoint slices of the tests
+        self._shard_end = None # end of the contiguous block of this shard
+        self._shard_stride = False # shard by test index modulo n
+
+        if shard != None:
+            k, n = shard
+            if (n < 1) or (k < 0) or (k >= n):
+                raise Exception("Invalid shard (%s, %s): expected (k, n) with 0 <= k < n"%(k, n))
+            self._shard = (k, n)
+
+        # factories of an already seen request of this class reuse its compiled template
+        key = (self.__class__, req)
+        template = _template_cache.get(key)
+        if template != None:
+            self._load_template(template)
+        else:
+            # parse all attributes of this class looking for iterative and persistent transformers
+            for item in dir(self):
+                if ((len(item) >= 6) and (item[0:5] == "test_")):
+                    self._iterative_transformers += [item[5:]]
+                elif ((len(item) >= 5) and (item[0:4] == "per_")):
+                    self._persistent_transformers += [item[4:]]
+                    
+            # With all transformers identfied, now parse the tagged data
+            self._parse()
+            for i in range(len(self._iterative_operations)):
+                self._iterative_operations[i]['position'] = i
+                self._iterative_operations[i]['radix'] = 1
+            _template_cache.put(key, self._save_template())
+        self._bind_operations()
+
+    # return the compiled template of the request, the result of transformer discovery and parsing
+    def _save_template(self):
+        return (list(self._iterative_transformers), list(self._persistent_transformers), self._iterative_operation_type,
+                list(self._segments), [dict(operation) for operation in self._iterative_operations],
+                [dict(operation) for operation in self._persistent_operations])
+
+    # set up this instance from a compiled template, operations are copied because they
+    # hold the per instance iteration values
+    def _load_template(self, template):
+        iterative_transformers, persistent_transformers, iterative_operation_type, segments, iterative_operations, persistent_operations = template
+        self._iterative_transformers = list(iterative_transformers)
+        self._persistent_transformers = list(persistent_transformers)
+        self._iterative_operation_type = iterative_operation_type
+        self._segments = list(segments)
+        self._iterative_operations = [dict(operation) for operation in iterative_operations]
+        self._persistent_operations = [dict(operation) for operation in persistent_operations]
         
     # return the name of our transform we are currently running
     def me(self):
@@ -200,41 +1083,140 @@ class Transform():
     # set the randomize lists flag
     def randomize_lists(self, val):
         self._randomize_lists = val
+
+    # With a campaign seed, also seed the random module like state.random for every call so
+    # that transforms which use the random module directly are reproducible. The random module
+    # is shared with the host script and all threads (e.g. TestProducer workers), transforms
+    # should rather use state.random.
+    def seed_random(self, enabled=True):
+        self._seed_random = enabled
+
+    # Skip tests which were already generated since iteration was started, see TestFilter.
+    # The test count of a transform does not account for skipped tests.
+    def dedupe(self, enabled=True, exact=100000, capacity=10000000, error_rate=0.001):
+        self._dedupe = None
+        if enabled:
+            self._dedupe = TestFilter(exact, capacity, error_rate)
+
+    # Record the time spent in every transform function and in haptyc while tests are
+    # generated, see Profiler. At the end of iteration a report is written to file
+    # (standard output by default) as a "table" or as "json", report=None disables it.
+    # Without profiling transforms are called directly.
+    def profile(self, enabled=True, report="table", file=None):
+        self._profiler = None
+        if enabled:
+            self._profiler = Profiler(report, file)
+        wrap = lambda name, func: func
+        if self._profiler != None:
+            wrap = self._profiler.wrap
+        # operations keep their states, functions are looked up again to drop earlier wrappers
+        self._calls = [(name, wrap(name, getattr(self, name)), state) for name, func, state in self._calls]
+        self._pipelines = [(slot, data, [(name, wrap(name, getattr(self, name)), state) for name, func, state in chain])
+                           for slot, data, chain in self._pipelines]
+        self._dynamic_pipelines = None
+        self._frames = None
+
+    # return the report of profile() as a "table" or as "json"
+    def profile_report(self, format="table"):
+        if self._profiler == None:
+            return None
+        return self._profiler.report(format)
+
+    # return the number of generated and skipped tests and the hit rate of dedupe()
+    def dedupe_stats(self):
+        if self._dedupe == None:
+            return None
+        return self._dedupe.stats()
         
-    # return this transformer's state object
+    # return the state object of the transform we are currently running
     def get_state(self):
-        class state(object):
-            pass
-            
-        # the key into gstate is the transform name
-        # because we only look back a frame the caller
-        # must be the transform function
-        key = self._transform_context
-        
-        # if we don't yet have state for this transform
-        # then create it and store it
-        if key not in self._gstate:
-            stateobj = state()
-            self._gstate[key] = stateobj
-        else:
-            stateobj = self._gstate[key]
-            
-        # return the state object
-        return stateobj
+        if self._state == None:
+            self._state = TransformState()
+        return self._state
         
     def stop(self):
         raise StopIteration
+
+    # return the number of tests generated by an iterative operation or None if unknown
+    def _operation_count(self, operation):
+        count = getattr(getattr(self, operation['funcname']), "haptyc_count", None)
+        if count == None:
+            return None
+        return count(self)
+
+    # Compute the number of tests this transform generates without generating them.
+    # Counts come from the logic decorators of each iterative transform, if any transform
+    # has no known count (e.g. it is not decorated) None is returned. A transform which
+    # stops early with self.stop() generates less tests than counted.
+    def count(self):
+        counts = []
+        for operation in self._iterative_operations:
+            count = self._operation_count(operation)
+            if count == None:
+                return None
+            counts += [count]
+        if len(counts) == 0:
+            return 0
+        if self._iterative_operation_type == 0: # sniper runs every operation one after another
+            return sum(counts)
+        elif self._iterative_operation_type == 1: # battering ram/pitchfork stops with its shortest operation
+            return min(counts)
+        # clusterbomb generates every combination, an exhausted outer operation stops the attack
+        total = counts[0]
+        for count in counts[1:]:
+            if count == 0:
+                break
+            total *= count
+        return total
+
+    def __len__(self):
+        count = self.count()
+        if count == None:
+            raise TypeError("Test count of this transform is unknown")
+        return count
+
+    # a transform is always true, even with a test count of 0 or an unknown count
+    def __nonzero__(self):
+        return True
+    __bool__ = __nonzero__
           
+    # return the index of the last generated test
+    def get_index(self):
+        return self._test_index - 1
+
+    # Report the response of a test back to the transforms which generated it. The test is
+    # given by its index (get_index() after it was generated) or by its label. Transforms
+    # decorated with @ApplyAdaptive use it to pick what they mutate next. Status, length
+    # and time (ms) make up the class of the response, score is an interestingness score
+    # (more than 0 is interesting). Returns False if the test is not known (anymore).
+    def feedback(self, index=None, status=None, length=None, time=None, score=None, label=None):
+        if index == None:
+            if label == None:
+                raise Exception("feedback needs the index or the label of a test")
+            index = self._feedback_labels.get(label)
+            if index == None:
+                return False
+        outputs = self._feedback_tests.get(index)
+        if outputs == None:
+            return False
+        cls = response_class(status, length, time)
+        for corpus, seed, payload in outputs:
+            corpus.feedback(seed, payload, cls, score)
+        return True
+
     def get_label(self):
         return self._label
     
     def set_label(self,label):
+        if self._async != None:
+            self._async.set_label(label)
         self._label = label
             
     def get_input(self,transform):
         input = None
         for operation in (self._iterative_operations+self._persistent_operations):
-            if operation['funcname'] == transform:
+            # every transform of a piped persistent operation gets the inner data of its tag
+            if transform in operation.get('funcnames', (operation['funcname'],)):
                 if input != None:
                     raise Exception("Getting input on multi-instance transforms is not allowed.")
                 input = operation['data']
@@ -260,283 +1242,621 @@ class Transform():
     # when evaluating a transform as an iterator, python first calls this base function
     def __iter__(self):
         self._operationindex = 0
-        
+
+        # iteration was already positioned by seek, continue from there
+        if self._seeked:
+            self._seeked = False
+            return self
+        self._rewind()
+            
+        # Return the class instance itself as an iterator
+        return self
+
+    # Look up the transform function of every operation once and create its state, operations
+    # are called through these tables instead of by name for every test
+    def _bind_operations(self):
+        calls = []
+        # without a campaign seed the random streams are seeded from the random module
+        for operation in self._iterative_operations:
+            state = TransformState()
+            state.random = random.Random(random.getrandbits(64))
+            calls += [(operation['funcname'], getattr(self, operation['funcname']), state)]
+        pipelines = []
+        for operation in self._persistent_operations:
+            chain = [(name, getattr(self, name), TransformState()) for name in operation['funcnames']]
+            # the transforms of a pipe share one random stream
+            stream = random.Random(random.getrandbits(64))
+            for name, func, state in chain:
+                state.random = stream
+            pipelines += [(operation['slot'], operation['data'], chain)]
+        self._calls = calls
+        self._pipelines = pipelines
+        self._dynamic_pipelines = None
+        self._frames = None
+        self._memos = [None] * len(calls)
+
+    # Sniper tests only differ in the slot of the active operation. For every iterative
+    # operation build a frame of the request: the literal text and the original data of all
+    # other iterative slots are joined ahead of time so that only the active slot and the
+    # persistent slots are left to fill. The persistent operations of a frame have their
+    # slots moved to the frame.
+    def _build_frames(self):
+        join = ''.join
+        if self._binary:
+            join = b''.join
+        persistent = set([slot for slot, data, chain in self._dynamic_pipelines])
+        frames = []
+        for operation in self._iterative_operations:
+            parts = []
+            slots = {}
+            text = []
+            for i in range(len(self._segments)):
+                if (i == operation['slot']) or (i in persistent):
+                    parts += [join(text)]
+                    text = []
+                    slots[i] = len(parts)
+                    parts += [self._segments[i]]
+                else:
+                    text += [self._segments[i]]
+            parts += [join(text)]
+            pipelines = [(slots[slot], data, chain) for slot, data, chain in self._dynamic_pipelines]
+            frames += [(parts, slots[operation['slot']], pipelines)]
+        self._frames = frames
+
+    # The input of a persistent operation never changes, a pipe of deterministic transforms
+    # always renders the same output. These pipes are evaluated once and their output is
+    # placed into the segment list, all other pipes are left to evaluate for every test.
+    def _fold_pipelines(self):
+        dynamic = []
+        for slot, data, chain in self._pipelines:
+            for name, func, state in chain:
+                if not getattr(getattr(self, name), "haptyc_deterministic", False):
+                    dynamic += [(slot, data, chain)]
+                    break
+            else:
+                parts = list(self._segments)
+                self._evaluate_persistent_transformers(parts, [(slot, data, chain)])
+                self._segments[slot] = parts[slot]
+        self._dynamic_pipelines = dynamic
+        self._frames = None
+
+    # return the states of all operations, iterative operations first
+    def _bound_states(self):
+        states = [state for name, func, state in self._calls]
+        for slot, data, chain in self._pipelines:
+            states += [state for name, func, state in chain]
+        return states
+
+    # call an iterative operation with the init flag set to True and return its state
+    def _init_operation(self, operation):
+        self._transform_context, func, state = self._calls[operation['position']]
+        self._state = state
+        state.init = True
+        # an init can load different data (e.g. shuffle a list), record the outputs again
+        if self._memos[operation['position']] != None:
+            self._memos[operation['position']] = OperationMemo()
+        if self._seed != None:
+            seed = derive_seed(self._seed, operation['position'], "init")
+            state.random.seed(seed)
+            if self._seed_random:
+                random.seed(seed)
+        _active.random = state.random
+        output = func(operation['data'], state)
+        if self._async != None:
+            # the init of an async transform is awaited by the async iterator
+            self._async.init(output)
+        elif hasattr(output, "__await__"):
+            # without an async iterator the init of an async transform can't run
+            output.close()
+        return state
+
+    # call an iterative operation to generate its next output
+    def _call_operation(self, operation):
+        self._transform_context, func, state = self._calls[operation['position']]
+        self._state = state
+        state.init = False
+        if self._seed != None:
+            # the random stream of an operation output depends on the test which first
+            # uses it (an outer clusterbomb output is generated once for many tests)
+            # so that it does not depend on where iteration started
+            index = self._test_index
+            seed = derive_seed(self._seed, operation['position'], index - index % operation['radix'])
+            state.random.seed(seed)
+            if self._seed_random:
+                random.seed(seed)
+        _active.random = state.random
+        output = func(operation['data'], state)
+        if self._binary:
+            output = output_bytes(output)
+        return output
+
+    # Generate the next output of a battering ram/pitchfork or clusterbomb operation. The
+    # outputs of a memoized operation are recorded while it runs from its first output and
+    # served from its memo once it has run through all of them.
+    def _next_output(self, operation):
+        memo = self._memos[operation['position']]
+        digit = operation['digit']
+        if (memo == None) or (digit == None):
+            return self._call_operation(operation)
+        if memo.complete:
+            if digit == len(memo.outputs):
+                raise StopIteration
+            output, label = memo.outputs[digit]
+            if label != "":
+                self.set_label(label)
+            operation['digit'] = digit + 1
+            return output
+
+        label = self._label
+        self._label = ""
+        try:
+            output = self._call_operation(operation)
+        except StopIteration:
+            self._label = label
+            if digit == len(memo.outputs):
+                memo.complete = True
+            raise
+        if hasattr(output, "__await__"): # the output of an async transform is awaited once
+            self._memos[operation['position']] = None
+        elif digit == len(memo.outputs):
+            memo.outputs += [(output, self._label)]
+        if self._label == "":
+            self._label = label
+        operation['digit'] = digit + 1
+        return output
+
+    # Give the operations of deterministic transforms a memo. Dimensions need a known count and
+    # a logic decorator which supports seeking, the smallest are memoized first while the sum
+    # of their counts fits into the memo size. Only clusterbomb operations are rewound, sniper
+    # and battering ram/pitchfork operations run only once and get none.
+    def _prepare_memos(self):
+        self._memos = [None] * len(self._iterative_operations)
+        if self._iterative_operation_type != 2:
+            return
+        dimensions = []
+        for operation in self._iterative_operations:
+            func = getattr(self, operation['funcname'])
+            if getattr(func, "haptyc_deterministic", False) and (getattr(func, "haptyc_seek", None) != None):
+                count = self._operation_count(operation)
+                if count != None:
+                    dimensions += [(count, operation['position'])]
+        size = _memo_size
+        for count, position in sorted(dimensions):
+            if count > size:
+                break
+            size -= count
+            self._memos[position] = OperationMemo()
+
+    # With a campaign seed every clusterbomb operation needs the number of tests between
+    # changes of its output, this is only known if all counts are known
+    def _prepare_seed(self):
+        if (self._seed == None) or (self._iterative_operation_type != 2):
+            return
+        counts = [self._operation_count(operation) for operation in self._iterative_operations]
+        radix = 1
+        for i in range(len(self._iterative_operations)):
+            self._iterative_operations[i]['radix'] = radix
+            if (counts[i] == None) or (radix == None):
+                radix = None
+                self._iterative_operations[i]['radix'] = 1
+            elif counts[i] > 0:
+                radix *= counts[i]
+
+    # Rewind an iterative operation to its first output by initializing it again, the logic
+    # decorators keep the data they loaded (e.g. a wordlist) across inits. A deterministic
+    # operation which has recorded all of its outputs is replayed without running again.
+    def _rewind_operation(self, operation):
+        operation['digit'] = 0
+        memo = self._memos[operation['position']]
+        if (memo != None) and memo.complete:
+            return
+        self._init_operation(operation)
+
+    # initialize an iterative operation so that its next call generates its test number index
+    def _seek_operation(self, operation, index):
+        state = self._init_operation(operation)
+        seek = getattr(getattr(self, operation['funcname']), "haptyc_seek", None)
+        if seek == None:
+            raise Exception("Transform function '%s' does not support seeking"%(operation['funcname']))
+        seek(self, state, index)
+
+    # reset the iteration position to test number index
+    def _reset_position(self, index):
+        self._iterative_operation_index = 0
+        self._test_index = index
+        self._exhausted = False
+        self._label = ""
+        self._frame = None
+        self._parts = None
+        for operation in self._iterative_operations:
+            operation['cached'] = None
+            operation['digit'] = 0 # position of the next output of the operation
+        if self._dedupe != None:
+            self._dedupe.clear()
+
+    # reset iteration to the first test, or the first test of our shard
+    def _rewind(self):
+        self._prepare_seed()
+        self._prepare_memos()
+        if self._shard != None:
+            k, n = self._shard
+            total = self.count()
+            self._shard_stride = (total == None)
+            if total != None:
+                # every shard takes a contiguous block of tests
+                start = total * k // n
+                self._shard_end = total * (k + 1) // n
+                self._position(start)
+                return
+        self._reset_position(0)
+
         # Every iterative transformer provides its own iteration routine
         # If there exists at least 1 iterative transformer, call the transformer
         # with the init flag set to True so that it can set up its initial state
         if len(self._iterative_operations):
             if self._iterative_operation_type == 0:
-                operation = self._iterative_operations[0]
-                self._transform_context = "test_" + operation['transformer']
-                state = self.get_state()
-                state.init = True
-                getattr(self, self._transform_context)(operation['data'], state)
+                self._init_operation(self._iterative_operations[0])
             else:
                 for operation in self._iterative_operations:
-                    self._transform_context = "test_" + operation['transformer']
-                    state = self.get_state()
-                    state.init = True
-                    getattr(self, self._transform_context)(operation['data'], state)
+                    self._init_operation(operation)
 
-            
-        # Return the class instance itself as an iterator
-        return self
-    
-    def _get_tags(self, transformer, trans_type):
-        if (trans_type == 0): # sniper
-            return ("[+"+transformer+']', "[+end]")
-        elif (trans_type == 1): # battering ram/Pitchfork
-            return ("[#"+transformer+']', "[#end]")
-        elif (trans_type == 2): # clusterbomb
-            return ("[%"+transformer+']', "[%end]")
-        raise Exception("Unknown Iterative Transformer Type")
-        
-    
+    # Position iteration so that the next generated test is test number index, without
+    # generating any of the tests before it. The global test index is decomposed into
+    # an index for every iterative operation: an offset into the operations for sniper,
+    # the same index for battering ram/pitchfork and a mixed-radix number for clusterbomb
+    # with the first operation as the fastest changing digit. Every transform needs a
+    # known count and a logic decorator which supports seeking.
+    def seek(self, index):
+        self._prepare_seed()
+        self._prepare_memos()
+        self._position(index)
+        self._seeked = True
+
+    def _position(self, index):
+        total = self.count()
+        if total == None:
+            raise Exception("Cannot seek a transform with an unknown test count")
+        if index < 0:
+            index += total
+        if (index < 0) or (index > total):
+            raise IndexError("Test index out of range")
+
+        self._reset_position(index)
+        if index == total:
+            self._exhausted = True
+            return
+
+        counts = [self._operation_count(operation) for operation in self._iterative_operations]
+        if self._iterative_operation_type == 0:
+            # find the operation which generates this test
+            k = 0
+            while index >= counts[k]:
+                index -= counts[k]
+                k += 1
+            self._iterative_operation_index = k
+            self._seek_operation(self._iterative_operations[k], index)
+        elif self._iterative_operation_type == 1:
+            for operation in self._iterative_operations:
+                self._seek_operation(operation, index)
+                operation['digit'] = index
+        else:
+            for i in range(len(self._iterative_operations)):
+                digit = 0
+                if counts[i] > 0:
+                    digit = index % counts[i]
+                    index //= counts[i]
+                # outer operations get their value from their next call (cached is None)
+                self._seek_operation(self._iterative_operations[i], digit)
+                self._iterative_operations[i]['digit'] = digit
+
+    # Generate tests in a pool of worker processes. Every worker is a forked copy of this
+    # transform (with its own transform state) which seeks to a chunk of tests and returns
+    # them in one batch. With ordered=True the tests are returned in test order, otherwise
+    # in the order their chunks finish. This needs a known test count and a platform
+    # which forks processes. With labels=True (test, label) tuples are returned.
+    def parallel_iter(self, workers=None, ordered=False, chunk=1000, labels=False):
+        global _parallel_factory
+        if multiprocessing == None:
+            raise Exception("parallel_iter requires the multiprocessing module")
+        if hasattr(multiprocessing, "get_all_start_methods") and ("fork" not in multiprocessing.get_all_start_methods()):
+            raise Exception("parallel_iter requires a platform which forks processes")
+        total = self.count()
+        if total == None:
+            raise Exception("parallel_iter requires a transform with a known test count")
+
+        # generate the whole campaign or the block of our shard
+        start, end = 0, total
+        if self._shard != None:
+            k, n = self._shard
+            start, end = total * k // n, total * (k + 1) // n
+        chunks = [(i, min(i + chunk, end)) for i in range(start, end, chunk)]
+
+        _parallel_factory = self
+        if hasattr(multiprocessing, "get_context"):
+            pool = multiprocessing.get_context("fork").Pool(workers)
+        else:
+            pool = multiprocessing.Pool(workers)
+        try:
+            if ordered:
+                results = pool.imap(_parallel_chunk, chunks)
+            else:
+                results = pool.imap_unordered(_parallel_chunk, chunks)
+            if self._dedupe != None:
+                self._dedupe.clear()
+            for tests in results:
+                for test in tests:
+                    if (self._dedupe != None) and self._dedupe.add(test[0]):
+                        continue
+                    if labels:
+                        yield test
+                    else:
+                        yield test[0]
+            pool.close()
+        finally:
+            pool.terminate()
+            pool.join()
+            _parallel_factory = None
+
+    # Return the position of the test generation as a json string: the test index, the
+    # active operation, the cached operation outputs, the simple attributes (numbers,
+    # strings and lists of them) of every transform state and the random module state.
+    # A campaign can store it every N tests and continue from it after a restart with
+    # restore() in constant time. Wordlists are loaded again by the transform init on
+    # restore, randomized lists only get the same order again with a campaign seed.
+    def checkpoint(self):
+        # an operation served from its memo does not move its state, position it
+        for operation in self._iterative_operations:
+            memo = self._memos[operation['position']]
+            if (memo != None) and memo.complete:
+                name, func, state = self._calls[operation['position']]
+                getattr(self, operation['funcname']).haptyc_seek(self, state, operation['digit'])
+        states = []
+        for state in self._bound_states():
+            states += [{}]
+            for key, value in state.items():
+                if key in CHECKPOINT_SKIP:
+                    continue
+                value = checkpoint_value(value)
+                if value != None:
+                    states[-1][key] = value[0]
+            # with a campaign seed the streams are seeded again for every output
+            if self._seed == None:
+                version, internal, gauss = state.random.getstate()
+                states[-1]["random"] = [version, list(internal), gauss]
+        # an output which can't be represented is generated again on restore
+        cached = []
+        for operation in self._iterative_operations:
+            value = checkpoint_value(operation['cached'])
+            if value == None:
+                value = [None]
+            cached += value
+        version, internal, gauss = random.getstate()
+        return json.dumps({
+            "version": 2,
+            "request": self._request_digest(),
+            "test_index": self._test_index,
+            "operation_index": self._iterative_operation_index,
+            "exhausted": self._exhausted,
+            "shard_end": self._shard_end,
+            "cached": cached,
+            "states": states,
+            "random": [version, list(internal), gauss],
+        })
+
+    def _request_digest(self):
+        data = self._data
+        if not isinstance(data, bytes):
+            data = data.encode("utf-8")
+        return hashlib.md5(data).hexdigest()
+
+    # Continue test generation from a checkpoint() of a transform of the same request
+    def restore(self, blob):
+        checkpoint = json.loads(blob)
+        if checkpoint.get("version") != 2:
+            raise Exception("Unknown checkpoint version")
+        if checkpoint["request"] != self._request_digest():
+            raise Exception("Checkpoint was taken from a different request")
+
+        self._prepare_seed()
+        self._prepare_memos()
+        self._reset_position(checkpoint["test_index"])
+        self._iterative_operation_index = checkpoint["operation_index"]
+        self._exhausted = checkpoint["exhausted"]
+        self._shard_end = checkpoint["shard_end"]
+        self._shard_stride = (self._shard != None) and (self._shard_end == None)
+
+        # run the init of every active operation so that it loads its data again
+        if len(self._iterative_operations) and not self._exhausted:
+            if self._iterative_operation_type == 0:
+                self._init_operation(self._iterative_operations[self._iterative_operation_index])
+            else:
+                for operation in self._iterative_operations:
+                    self._init_operation(operation)
+
+        # then restore the position of every state
+        for state, values in zip(self._bound_states(), checkpoint["states"]):
+            for key, value in values.items():
+                if key == "random":
+                    version, internal, gauss = value
+                    state.random.setstate((version, tuple(internal), gauss))
+                    continue
+                setattr(state, str(key), restore_value(value))
+        for operation, cached in zip(self._iterative_operations, checkpoint["cached"]):
+            operation['cached'] = restore_value(cached)
+            # the operation is memoized again from its next sweep
+            operation['digit'] = None
+            if self._binary and (operation['cached'] != None):
+                operation['cached'] = str_to_bytes(operation['cached'])
+
+        version, internal, gauss = checkpoint["random"]
+        random.setstate((version, tuple(internal), gauss))
+        self._seeked = True
+
+    # return test number index and continue iteration after it
+    def __getitem__(self, index):
+        # seek() accepts the end position, it has no test
+        if index == self.count():
+            raise IndexError("Test index out of range")
+        self.seek(index)
+        self._seeked = False
+        return self.next()
     
-    # This is the function in charge of processing all found iterative transformers
-    # in the body of data
-    def _parse_iterative(self, dat):
-        endtags = ["[+end]","[#end]","[%end]"]
+    # This is the single pass tokenizer which parses all transformer tags in the body of data
+    # and compiles it into a list of segments. Literal text stays as is and every tag becomes
+    # a slot which holds the original inner data of its transform. Each operation records
+    # the index of its slot so that rendering a test is a single join over a copy of the
+    # segment list. Text inside of a tag is inner data, tags in there are not parsed.
+    # Raw bytes requests are parsed as latin-1 text and their segments are bytes again.
+    def _parse(self):
+        dat = self._data
+        if self._binary:
+            dat = bytes_to_str(dat)
+        tokens = list(TAG_PATTERN.finditer(dat))
+
+        # the end tags in the data select the iterative transformer type, they can't be mixed
         self._iterative_operation_type = -1
-        for i in range(len(endtags)):
-            if endtags[i] in dat:
-                if ((self._iterative_operation_type > -1) and (self._iterative_operation_type != i)):
-                    raise Exception("Cannot mix iterative transformer types: %s and %s"%(self._trans_types[self._iterative_operation_type],self._trans_types[i]))
-                self._iterative_operation_type = i
-        
-        # There appears to be no iterative transformers, return the payload as is for persistent transformer parsing
-        if self._iterative_operation_type == -1:
-            return dat
-    
-        # we first iterate through all known iterative transformers
-        for transformer in self._iterative_transformers:
-            trans_type = self._iterative_operation_type
-            # we prep the tag literals for search
-            starttag, endtag = self._get_tags(transformer, trans_type)
-
-            curr = 0
-            while 1:
-                # We first look for any sign of syntax open with a valid transformer name
-                # if none is found we break and loop into the next transformer
-                s = dat.find(starttag,curr)
-
-                if s == -1:
-                    break
-                    
-                if ((trans_type == 1) or (trans_type == 2)):
-                    for operation in self._iterative_operations:
-                        if operation["transformer"] == transformer:
-                            raise Exception("Cannot have more than 1 transformer instantiation of the same name in ram/cluster mode(%s)"%(transformer))
-                    
-                
-                # Next we make sure we find a proper end tag so that we understand how to
-                # parse the data we want to transform, we raise exception if none is found
-                e = dat.find(endtag,s)
-                
-                if (e == -1):
-                    raise Exception("Could Not Parse Iterative Transformation End Tag")
-                    
-                # Back to open tag processing, locate the end bracket so we can parse
-                # the inner text and also the inner tag
-                sc = -1
-                for i in range(s,e):
-                    if dat[i] == ']':
-                       sc = i
-                       break
-                       
-                # sc contains the location of the close bracket, if none is found raise exception
-                if sc == -1:
-                    raise Exception("Could Not Parse Iterative Transformation Start Tag")
-                
-                # With the start tag end known, we can parse the inner text
-                inner = dat[sc+1:e]
-                
-                
-                # Lets produce a high-entropy unique alias for future text replacement
-                alias = get_random_string(32)
-                
-                # validate tag annotations for multiple interative transformers
-                annotations = dat[s+2:sc]
-                
-                # BUG (9/8/21): cumulative iterative transforms at the moment are broken and 
-                # not possible until the tag parsing logic is fixed
-                #
-                # If the inner tag annotions contain a ; character then we know that we are dealing
-                # with cumulative iterative transformers, lets process each of them
-                # This is only allowed for sniper type iterative transformers
-                if ((';' in annotations) and (trans_type == 0)):
-                    # split the inner tag text with ; as a delimiter, and iterate through each
-                    transformers = annotations.split(';')
-                    for trans in transformers:
-                        # clean up any whitespace and ignore empty tranformer names
-                        trans = trans.strip()
-                        if trans == "":
-                            continue
-                            
-                        # Validate that a given annotated transformer name indeed exists
-                        # otherwise raise exception
-                        if trans not in self._iterative_transformers:
-                            raise Exception("Invalid Iterative Transformer: %s"%(trans))
-                            
-                        # for each valid transformer, add them to the operation list
-                        # with its alias and original inner data
-                        funcname = "test_"+trans
-                        operation = {"transformer":trans,"funcname":funcname,"alias":alias,"data":inner,"cached":None}
-                        self._iterative_operations += [operation]
-                else:
-                    # If this is not a cumulative iterative transformer then validate that
-                    # the inner tag text exactly matches the transformer name
-                    if transformer.strip() != annotations.strip():
-                        curr = s+1
-                        continue
-                        
-                    # Add this single transformer operation to the list with alias and
-                    # original inner data
-                    funcname = "test_"+transformer
-                    operation = {"transformer":transformer,"funcname":funcname,"alias":alias,"data":inner,"cached":None}
-                    self._iterative_operations += [operation]
-                
-                # As we find valid transformer markup, lets replace the entire markup
-                # with the high entropy alias on the data we are parsing
-                dat = dat[0:s] + alias + dat[e+len(endtag):]
-       
-        # return the data with alias decorations
-        return dat
-
-    # This is the function in charge of processing all found persistent transformers
-    # in the body of data        
-    def _parse_persistent(self, dat):
-        # we first iterate through all known persistent transformers
-        for transformer in self._persistent_transformers:
-            # we prep the tag literals for search
-            starttag = "[@"+transformer+']'
-            endtag = "[@end]"
-            curr = 0
-            while 1:
-                # We first look for any sign of syntax open with a valid transformer name
-                # if none is found we break and loop into the next transformer
-                s = dat.find(starttag,curr)
-                if s == -1:
-                    break
-                    
-                # Next we make sure we find a proper end tag so that we understand how to
-                # parse the data we want to transform, we raise exception if none is found
-                e = dat.find(endtag,s)
-                if (e == -1):
-                    raise Exception("Could Not Parse Persistent Transformation End Tag")
-                    
-                # Back to open tag processing, locate the end bracket so we can parse
-                # the inner text and also the inner tag
-                sc = -1
-                for i in range(s,e):
-                    if dat[i] == ']':
-                       sc = i
-                       break
-                # sc contains the location of the close bracket, if none is found raise exception
-                if sc == -1:
-                    Exception("Could Not Parse Persistent Transformation Start Tag")
-
-                # With the start tag end known, we can parse the inner text
-                inner = dat[sc+1:e]
-                
-                # Lets produce a high-entropy unique alias for future text replacement
-                alias = get_random_string(32)
-                
-                # validate tag annotations for multiple Persistent transformers
-                annotations = dat[s+2:sc]
-                
-                # BUG (9/8/21): piped persistent transformers at the moment are broken and 
-                # not possible until the tag parsing logic is fixed
-                #
+        for token in tokens:
+            i = TAG_TYPES[token.group(1)]
+            if (i == -1) or (token.group(2) != "end"):
+                continue
+            if ((self._iterative_operation_type > -1) and (self._iterative_operation_type != i)):
+                raise Exception("Cannot mix iterative transformer types: %s and %s"%(self._trans_types[self._iterative_operation_type],self._trans_types[i]))
+            self._iterative_operation_type = i
+
+        # transformer name lookups, the rank keeps operations in transformer name order
+        iterative_rank = dict([(self._iterative_transformers[i], i) for i in range(len(self._iterative_transformers))])
+        persistent_rank = dict([(self._persistent_transformers[i], i) for i in range(len(self._persistent_transformers))])
+
+        segments = []
+        iterative = []
+        persistent = []
+        curr = 0
+        for t in range(len(tokens)):
+            token = tokens[t]
+            # skip tags inside of the inner data of the last parsed tag
+            if token.start() < curr:
+                continue
+            trans_type = TAG_TYPES[token.group(1)]
+            annotations = token.group(2)
+            if annotations == "end":
+                continue
+            
+            if trans_type == -1:
                 # If the inner tag annotions contain a | character then we know that we are dealing
-                # with piped persistent transformers, lets process each of them
+                # with piped persistent transformers, every one of them must exist
                 if '|' in annotations:
-                    # split the inner tag text with | as a delimiter, and iterate through each
-                    transformers = annotations.split('|')
+                    transformers = [trans.strip() for trans in annotations.split('|') if trans.strip() != ""]
                     for trans in transformers:
-                        # clean up any whitespace and ignore empty tranformer names
-                        trans = trans.strip()
-                        if trans == "":
-                            continue
-
-                        # Validate that a given annotated transformer name indeed exists
-                        # otherwise raise exception    
-                        if trans not in self._persistent_transformers:
+                        if trans not in persistent_rank:
                             raise Exception("Invalid Persistent Transformer: %s"%(trans))
-                            
-                    # add this valid piped persistent transformer operation as a single group 
-                    # with its alias and original inner data        
-                    operation = {"transformer":annotations, "alias":alias, "data":inner}
-                    self._persistent_operations += [operation]
+                # Otherwise the tag must name a persistent transformer, unknown tags are literal text
+                elif annotations in persistent_rank:
+                    transformers = [annotations]
                 else:
-                    # If this is not piped persistent transformers then validate that
-                    # the inner tag text exactly matches the transformer name
-                    if transformer.strip() != annotations.strip():
-                        curr = s+1
-                        continue
-                     
-                    # Add this single transformer operation to the list with alias and
-                    # original inner data
-                    operation = {"transformer":transformer,"funcname":"per_"+transformer ,"alias":alias, "data":inner}
-                    self._persistent_operations += [operation]
-                    
-                # As we find valid transformer markup, lets replace the entire markup
-                # with the high entropy alias on the data we are parsing 
-                dat = dat[0:s] + alias + dat[e+len(endtag):]
-        # return the data with alias decorations
-        return dat
-        
-    # This parse function called by the construct on instance creation
-    def _parse(self):
-        # Grap the object data
-        dat = self._data
-        # Parse and annotate all iterative transformers
-        dat = self._parse_iterative(dat)
-        # Parse and annotate all persistent transformers
-        dat = self._parse_persistent(dat)
-        # replace the object data with the new decorated data
-        self._data = dat
-        
-    # This function is processes the decorated data replacing all iterative transformers
-    # with its original data
-    def _evaluate_default_iterative_transformers(self,dat):
-        for operation in self._iterative_operations:
-            dat = dat.replace(operation['alias'], operation['data'])
-        return dat
+                    continue
+                endtag = "[@end]"
+            elif trans_type == self._iterative_operation_type:
+                # If the inner tag annotions contain a ; character then we know that we are dealing
+                # with cumulative iterative transformers, this is only allowed for sniper type
+                # iterative transformers and every one of them must exist
+                if (';' in annotations) and (trans_type == 0):
+                    transformers = [trans.strip() for trans in annotations.split(';') if trans.strip() != ""]
+                    for trans in transformers:
+                        if trans not in iterative_rank:
+                            raise Exception("Invalid Iterative Transformer: %s"%(trans))
+                # Otherwise the tag must name an iterative transformer, unknown tags are literal text
+                elif annotations in iterative_rank:
+                    transformers = [annotations]
+                else:
+                    continue
+                if ((trans_type == 1) or (trans_type == 2)):
+                    for operation in iterative:
+                        if operation["transformer"] == annotations:
+                            raise Exception("Cannot have more than 1 transformer instantiation of the same name in ram/cluster mode(%s)"%(annotations))
+                endtag = token.group(0)[0:2] + "end]"
+            else:
+                continue
+
+            # Next we make sure we find a proper end tag so that we understand how to
+            # parse the data we want to transform, we raise exception if none is found
+            e = dat.find(endtag, token.end())
+            if (e == -1):
+                if trans_type == -1:
+                    raise Exception("Could Not Parse Persistent Transformation End Tag")
+                raise Exception("Could Not Parse Iterative Transformation End Tag")
+            inner = dat[token.end():e]
+
+            # iterative transformers are evaluated before persistent transformers, so they can't
+            # be placed inside of a persistent transformer
+            if trans_type == -1:
+                for nested in tokens[t+1:]:
+                    if nested.end() > e:
+                        break
+                    if (TAG_TYPES[nested.group(1)] == self._iterative_operation_type) and (nested.group(2) in iterative_rank):
+                        raise Exception("Iterative transformers cannot be nested inside persistent transformers")
+
+            # add the literal text before the tag and the slot of the tag
+            segments += [dat[curr:token.start()]]
+            slot = len(segments)
+            segments += [inner]
+            curr = e + len(endtag)
+
+            if trans_type == -1:
+                # a piped persistent transformer operation is added as a single group, funcnames
+                # holds the transform functions of the pipe in order
+                funcnames = ["per_"+trans for trans in transformers]
+                operation = {"transformer":"|".join(transformers),"funcname":"|".join(funcnames),"funcnames":funcnames,"data":inner,"slot":slot}
+                persistent += [(persistent_rank[transformers[0]], slot, operation)]
+            else:
+                # every cumulative iterative transformer gets an operation on the same slot
+                for trans in transformers:
+                    operation = {"transformer":trans,"funcname":"test_"+trans,"data":inner,"cached":None,"slot":slot}
+                    iterative += [operation]
+        segments += [dat[curr:]]
+
+        if self._binary:
+            segments = [str_to_bytes(segment) for segment in segments]
+            for operation in iterative:
+                operation['data'] = segments[operation['slot']]
+            for item in persistent:
+                item[2]['data'] = segments[item[2]['slot']]
+
+        # operations are run in transformer name order, then in order of appearance
+        iterative.sort(key=lambda operation: (iterative_rank[operation["transformer"]], operation["slot"]))
+        persistent.sort(key=lambda item: item[0:2])
+        self._iterative_operations = iterative
+        self._persistent_operations = [item[2] for item in persistent]
+        self._segments = segments
         
-    # This function processes the decorated data replacing all persistent transformers
+    # This function processes the segment list filling all persistent transformer slots
     # with its original data processed through each associated transforming function
-    def _evaluate_persistent_transformers(self,dat):
+    # and returns the rendered data
+    def _evaluate_persistent_transformers(self,parts,pipelines=None):
+        if pipelines == None:
+            pipelines = self._dynamic_pipelines
         # process all persistent operations
-        for operation in self._persistent_operations:
-            # piped transformer flow
-            if '|' in operation['transformer']:
-                # build a pipe chain of functions
-                chain = operation['transformer'].split('|')
-                # start by caching the original data
-                current_data = operation['data']
-                # for each annotated persistent function
-                for trans in chain:
-                    # clean it
-                    trans = trans.strip()
-                    if trans == '':
-                        continue
-                    # call the associated processing function to transform the current_data variable
-                    self._transform_context = "per_" + trans
-                    current_data = getattr(self, self._transform_context)(current_data)
-            # non-piped persistent transformer flow
-            else:
-                # There exists only a single transformer, call the function on the operation data
-                self._transform_context = "per_" + operation['transformer']
-                current_data = getattr(self, self._transform_context)(operation['data'])
+        for slot, current_data, chain in pipelines:
+            # for each persistent function of the operation (more than one if piped), call the
+            # associated processing function to transform the current_data variable
+            _active.random = chain[0][2].random
+            for name, func, state in chain:
+                self._transform_context = name
+                self._state = state
+                current_data = func(current_data)
                 
             # for every operation piped or not, take the current_data in its transformed format
-            # and replace the decorated alias with it
-            dat = dat.replace(operation['alias'], current_data)
+            # and place it into the operation slot
+            if self._binary:
+                current_data = output_bytes(current_data)
+            parts[slot] = current_data
         # return the evaluated data
-        return dat
+        if self._binary:
+            return b''.join(parts)
+        return ''.join(parts)
         
     def _next_sniper(self):
+        if self._frames == None:
+            self._build_frames()
         while(1):
             # Starting at the first iterative operation, grab the operation
             operation = self._iterative_operations[self._iterative_operation_index]
@@ -544,14 +1864,7 @@ class Transform():
             # enclose in a try block to catch when the iterative transformer is complete
             try:
                 # Call the associated function to apply the transformation on the data
-                self._transform_context = "test_" + operation['transformer']
-                state = self.get_state()
-                state.init = False
-                transformed = getattr(self, self._transform_context)(operation['data'],state)
-                
-                # Replace the alias decoration in the data with the transformed data
-                alias = operation['alias']
-                data = self._data.replace(alias, transformed)
+                transformed = self._call_operation(operation)
                 operation['cached'] = transformed
                 
             # We came to the completion of given iterative operation
@@ -567,61 +1880,60 @@ class Transform():
                     
                 # We moved to a new iterative operation, call it with the init value True
                 # so that the iterative transform can initialize its state
-                self._transform_context = "test_" + operation['transformer']
-                state = self.get_state()
-                state.init = True
-                getattr(self, self._transform_context)(operation['data'],state)
+                self._init_operation(operation)
                 continue
                 
-            # At this point we have replaced the active iterative transform alias with transformed data
-            # now loop through all other inactive iterative transforms replacing their decorations with
-            # original data
-            for i in range(len(self._iterative_operations)):
-                if i == self._iterative_operation_index:
-                    continue
-                data = data.replace(self._iterative_operations[i]['alias'], self._iterative_operations[i]['data'])
-                self._iterative_operations[i]['cached'] = self._iterative_operations[i]['data']
+            # All other inactive iterative transforms hold their original data, they only
+            # need to be reset once the active operation changes
+            if self._frame != self._iterative_operation_index:
+                for i in range(len(self._iterative_operations)):
+                    if i != self._iterative_operation_index:
+                        self._iterative_operations[i]['cached'] = self._iterative_operations[i]['data']
+                self._frame = self._iterative_operation_index
 
-
-            return data
+            # Place the transformed data into the active slot of the operation frame
+            frame, slot, self._render_pipelines = self._frames[self._iterative_operation_index]
+            parts = list(frame)
+            parts[slot] = transformed
+            return parts
             
     def _next_ram(self):
-        data = self._data
+        parts = list(self._segments)
         stop = False
         for operation in self._iterative_operations:
             try:
                 # Call the associated function to apply the transformation on the data
-                self._transform_context = "test_" + operation['transformer']
-                state = self.get_state()
-                state.init = False
-                operation["cached"] = getattr(self, self._transform_context)(operation['data'],state)
+                operation["cached"] = self._next_output(operation)
                 
-                # Replace the alias decoration in the data with the transformed data
-                alias = operation['alias']
-                data = data.replace(alias, operation["cached"])
+                # Place the transformed data into the operation slot
+                parts[operation['slot']] = operation["cached"]
             except StopIteration:
                 stop = True
         if stop:
             raise StopIteration
-        return data
+        return parts
                 
         
+    # Clusterbomb operations count like an odometer with the first operation as the fastest
+    # changing digit. The segment list keeps the output of every operation between tests,
+    # a test only replaces the outputs of the digits which changed.
     def _next_cluster(self):
-        data = self._data
-        if (len(self._iterative_operations) > 1):
+        parts = self._parts
+        if parts == None:
+            # first test after a rewind or a seek, the outer operations generate their output
+            parts = list(self._segments)
             for i in range(1,len(self._iterative_operations)):
                 operation = self._iterative_operations[i]
                 if operation["cached"] == None:
                     try:
                         # Call the associated function to apply the transformation on the data
-                        self._transform_context = "test_" + operation['transformer']
-                        state = self.get_state()
-                        state.init = False
-                        operation["cached"] = getattr(self, self._transform_context)(operation['data'],state)                    
+                        operation["cached"] = self._next_output(operation)
                     # We came to the completion of given iterative operation
                     except StopIteration:
                         operation["cached"] = operation["data"]
-        
+                parts[operation['slot']] = operation["cached"]
+            self._parts = parts
+
         self._iterative_operation_index = 0
         while(1):
             # Starting at the first iterative operation, grab the operation
@@ -630,27 +1942,17 @@ class Transform():
             # enclose in a try block to catch when the iterative transformer is complete
             try:
                 # Call the associated function to apply the transformation on the data
-                self._transform_context = "test_" + operation['transformer']
-                state = self.get_state()
-                state.init = False
-                operation["cached"] = getattr(self, self._transform_context)(operation['data'],state)
+                operation["cached"] = self._next_output(operation)
                 
-                # Replace the alias decoration in the data with the transformed data
-                alias = operation['alias']
-                data = data.replace(alias, operation["cached"])
+                # Place the transformed data into the operation slot
+                parts[operation['slot']] = operation["cached"]
                 
             # We came to the completion of given iterative operation
             except StopIteration:
                 # Wrap
-                self._transform_context = "test_" + operation['transformer']
-                state = self.get_state()
-                state.init = True
-                getattr(self, self._transform_context)(operation['data'],state)
-                state = self.get_state()
-                state.init = False
-                operation["cached"] = getattr(self, self._transform_context)(operation['data'],state)
-                alias = operation['alias']
-                data = data.replace(alias, operation["cached"])
+                self._rewind_operation(operation)
+                operation["cached"] = self._next_output(operation)
+                parts[operation['slot']] = operation["cached"]
             
                 # Go to the next iterative operation
                 self._iterative_operation_index += 1
@@ -659,84 +1961,193 @@ class Transform():
                 if self._iterative_operation_index == len(self._iterative_operations):
                     raise StopIteration
                 continue
-                
-            for i in range(self._iterative_operation_index+1,len(self._iterative_operations)):
-                operation = self._iterative_operations[i]
-                alias = operation['alias']
-                data = data.replace(alias, operation["cached"])
-                
-            return data
-    
 
-        
+            return list(parts)
+
     # Our formal python iterator which evaluates all transforms
     def next(self):
-        # Clear our label
-        self._label = ""
-        
-        # if no iterative operations exist then theres noting to return
-        if (len(self._iterative_operations) == 0):
-                raise StopIteration
-                
-        # When processing iterative transforms, set the iterative mode variable        
-        self._iterative_mode = True
-        if self._iterative_operation_type == 0:
-            data = self._next_sniper()
-        elif self._iterative_operation_type == 1:
-            data = self._next_ram()
-        elif self._iterative_operation_type == 2:
-            data = self._next_cluster()
-        # When done processing iterative transforms, reset the iterative mode variable        
-        self._iterative_mode = False
-                
-        # As last step before we yield back this data, process any persistent tranformers that may
-        # exist in the data
-        return self._evaluate_persistent_transformers(data)
+        if self._profiler != None:
+            return self._profiler.next(self)
+        return self._next()
+    __next__ = next
+
+    def _next(self):
+        while True:
+            parts = self._next_parts()
+            # As last step before we yield back this data, process any persistent tranformers that may
+            # exist in the data
+            test = self._evaluate_persistent_transformers(parts, self._render_pipelines)
+            if (self._dedupe == None) or not self._dedupe.add(test):
+                return test
+
+    # Run the iterative transforms of the next test and return its segment list with the
+    # iterative outputs placed, the persistent transforms are not evaluated yet
+    def _next_parts(self):
+        if self._dynamic_pipelines == None:
+            self._fold_pipelines()
+        while True:
+            # Clear our label
+            self._label = ""
+            if self._feedback_pending: # outputs of a test which was not completed
+                self._feedback_pending = []
+            
+            # if no iterative operations exist then theres noting to return
+            if (len(self._iterative_operations) == 0) or self._exhausted:
+                    raise StopIteration
+
+            # the contiguous block of our shard is done
+            if (self._shard_end != None) and (self._test_index >= self._shard_end):
+                    raise StopIteration
+                    
+            # When processing iterative transforms, set the iterative mode variable        
+            self._iterative_mode = True
+            if self._iterative_operation_type == 0:
+                parts = self._next_sniper()
+            elif self._iterative_operation_type == 1:
+                parts = self._next_ram()
+            elif self._iterative_operation_type == 2:
+                parts = self._next_cluster()
+            # When done processing iterative transforms, reset the iterative mode variable        
+            self._iterative_mode = False
+            index = self._test_index
+            self._test_index += 1
+
+            # remember what the adaptive transforms generated for this test
+            if self._feedback_pending:
+                self._feedback_tests.put(index, self._feedback_pending)
+                if self._label != "":
+                    self._feedback_labels.put(self._label, index)
+                self._feedback_pending = []
+
+            # with an unknown test count every shard generates all tests but only
+            # keeps its own
+            if self._shard_stride and (index % self._shard[1] != self._shard[0]):
+                continue
+
+            if self._seed != None:
+                if self._seed_random:
+                    random.seed(derive_seed(self._seed, "persistent", index))
+                for slot, data, chain in self._dynamic_pipelines:
+                    chain[0][2].random.seed(derive_seed(self._seed, "persistent", slot, index))
+            return parts
+
+    # Generate the tests in lists of up to size tests, or of (test, label) tuples with
+    # labels=True, so that an engine can queue tests in bulk. Like iterating over the
+    # transform this starts with the first test unless it was positioned by seek().
+    def batches(self, size, labels=False):
+        if size < 1:
+            raise Exception("Batch size must be at least 1")
+        iter(self)
+        generate = self.next
+        while True:
+            batch = []
+            append = batch.append
+            try:
+                if labels:
+                    for i in range(size):
+                        test = generate()
+                        append((test, self._label))
+                else:
+                    for i in range(size):
+                        append(generate())
+            except StopIteration:
+                if len(batch):
+                    yield batch
+                return
+            yield batch
+
+    # asyncio iteration (python 3 only): async for test in TestFactory.aiter(concurrency).
+    # Transforms may be async functions, the tests are generated in order but up to
+    # concurrency tests are generated at the same time so that async transforms overlap.
+    # See aio.py for the details.
+    def aiter(self, concurrency=8, labels=False):
+        from .aio import AsyncTests
+        AsyncTests(self, concurrency, labels)
+        return self
+
+    def __aiter__(self):
+        if self._async == None:
+            self.aiter()
+        return self
+
+    def __anext__(self):
+        return self._async.next()
 
     # On eval we process all iterative transforms with their
     # original data, and we process all persistent transforms with their transformed data
     def eval(self):
-        data = self._data
-        data = self._evaluate_default_iterative_transformers(data)
-        data = self._evaluate_persistent_transformers(data)
-        return data
+        if self._dynamic_pipelines == None:
+            self._fold_pipelines()
+        parts = list(self._segments)
+        return self._evaluate_persistent_transformers(parts)
+
+# Mark a transform as deterministic: its output only depends on its data (and for iterative
+# transforms the position given by its logic decorator, put this decorator above it). In
+# clusterbomb mode iterative outputs are recorded once and replayed for every other sweep,
+# see set_memo_size(). A pipe of deterministic persistent transforms is evaluated once.
+def Deterministic(func):
+    return set_deterministic(func)
+
+# the number of values start + i*step before end, for float steps the closed form can
+# be off by one through rounding so it is corrected against the values themselves
+def range_count(start, end, step):
+    if isinstance(start, numbers.Integral) and isinstance(end, numbers.Integral) and isinstance(step, numbers.Integral):
+        if step > 0:
+            return max(0, (end - start + step - 1) // step)
+        return max(0, (start - end - step - 1) // -step)
+    if step > 0:
+        before_end = lambda value: value < end
+    else:
+        before_end = lambda value: value > end
+    count = max(0, int(math.ceil(float(end - start) / step)))
+    while before_end(start + count * step):
+        count += 1
+    while (count > 0) and not before_end(start + (count - 1) * step):
+        count -= 1
+    return count
 
 def ApplyRange(start,end,step=1):
     def decorator(func):
-        if get_transform_type(func.func_name) == -1: # This is a persistent transform
+        func = snapshot_calls(func)
+        if get_transform_type(func.__name__) == -1: # This is a persistent transform
             raise Exception("ApplyRange Cannot Modify Persistent Transforms")
         else: # Otherwise this is an iterative transform
             if step == 0:
                 raise Exception("ApplyRange step value must not be zero")
+            total = range_count(start, end, step)
             def count_impl_iter(self, data, state):
 
                 if state.init:
                     state.curr = start
                     state.end  = end
                     state.step = step
+                    state.index = 0
                     func(self, str(state.curr), state)
                     return
                     
-                if (state.step > 0):
-                    if (state.curr < state.end):
-                        data = state.curr
-                        state.curr += state.step
-                        return func(self, str(data), state)
-                    else:    
-                        raise StopIteration 
-                else:
-                    if (state.curr > state.end):
-                        data = state.curr
-                        state.curr += state.step
-                        return func(self, str(data), state)
-                    else:    
-                        raise StopIteration                     
-            return count_impl_iter
+                # the range ends after count() values so that the count always matches
+                # the number of tests, even when float steps do not add up to the end.
+                # Values are computed from the index instead of adding up the steps so
+                # that a seek gives the same values as iterating
+                if (state.index < total):
+                    data = start + state.index * step
+                    state.index += 1
+                    state.curr = start + state.index * step
+                    return func(self, str(data), state)
+                else:    
+                    raise StopIteration 
+            def count(self):
+                return total
+            def seek(self, state, index):
+                state.index = index
+                state.curr = start + index * step
+            return set_seek(set_count(count_impl_iter, count), seek)
     return decorator
     
 def ApplyIteration(iteration):
     def decorator(func):
-        if get_transform_type(func.func_name) == -1: # This is a persistent transform
+        func = snapshot_calls(func)
+        if get_transform_type(func.__name__) == -1: # This is a persistent transform
             raise Exception("ApplyIteration Cannot Modify Persistent Transforms")
         else: # Otherwise this is an iterative transform
             def iteration_impl_iter(self, data, state):
@@ -744,8 +2155,7 @@ def ApplyIteration(iteration):
                 if state.init:
                     state.iter = 0
                     state.limit = iteration
-                    func(self, data, state)
-                    return
+                    return func(self, data, state)
                     
                 if (state.iter < state.limit):
                     ret = func(self, data, state)
@@ -753,11 +2163,94 @@ def ApplyIteration(iteration):
                     return ret
                 else:    
                     raise StopIteration  
-            return iteration_impl_iter
+            def seek(self, state, index):
+                state.iter = index
+            return set_seek(set_count(iteration_impl_iter, lambda self: iteration), seek)
+    return decorator
+
+# Like ApplyIteration but the transform generates its tests in blocks: every call returns a
+# list of up to state.size payloads (e.g. from random_insert_batch) which are served one
+# by one before the transform is called again. Blocks start at multiples of size, with a
+# campaign seed every block is generated from its own random stream so that seeking into
+# a block generates the same block again.
+def ApplyBatch(iteration, size=100):
+    def decorator(func):
+        func = snapshot_calls(func)
+        if get_transform_type(func.__name__) == -1: # This is a persistent transform
+            raise Exception("ApplyBatch Cannot Modify Persistent Transforms")
+        else: # Otherwise this is an iterative transform
+            def batch_impl_iter(self, data, state):
+
+                if state.init:
+                    state.iter = 0
+                    state.limit = iteration
+                    state.batch = collections.deque()
+                    return func(self, data, state)
+
+                if (state.iter >= state.limit):
+                    raise StopIteration
+
+                # a restored checkpoint holds the rest of the block as a list
+                if not isinstance(state.batch, collections.deque):
+                    state.batch = collections.deque(state.batch)
+                if len(state.batch) == 0:
+                    start = state.iter - state.iter % size
+                    state.size = min(size, state.limit - start)
+                    if self._seed != None:
+                        seed = derive_seed(self._seed, self._transform_context, "batch", start)
+                        state.random.seed(seed)
+                        if self._seed_random:
+                            random.seed(seed)
+                    # drop the tests before our position when we were seeked into the block
+                    state.batch = collections.deque(func(self, data, state)[state.iter - start:state.size])
+                    if len(state.batch) == 0:
+                        raise StopIteration
+
+                ret = state.batch.popleft()
+                state.iter += 1
+                return ret
+            def seek(self, state, index):
+                state.iter = index
+                state.batch = collections.deque()
+            return set_seek(set_count(batch_impl_iter, lambda self: iteration), seek)
+    return decorator
+
+# Logic to generate N mutations where the transform is a mutator: it gets a payload of the
+# corpus as data and returns its mutation. Payloads are picked by their energy, mutations
+# which got new responses (reported with TestFactory.feedback()) join the corpus, so the
+# transform spends its iterations on the payloads which find new behaviour. The corpus
+# is kept when the transform is initialized again.
+def ApplyAdaptive(iteration, corpus=256):
+    def decorator(func):
+        func = snapshot_calls(func)
+        if get_transform_type(func.__name__) == -1: # This is a persistent transform
+            raise Exception("ApplyAdaptive Cannot Modify Persistent Transforms")
+        else: # Otherwise this is an iterative transform
+            def adaptive_impl_iter(self, data, state):
+
+                if state.init:
+                    state.iter = 0
+                    state.limit = iteration
+                    if getattr(state, "corpus", None) == None:
+                        state.corpus = AdaptiveCorpus(data, corpus)
+                    return func(self, data, state)
+
+                if (state.iter < state.limit):
+                    seed = state.corpus.choose()
+                    ret = func(self, seed[0], state)
+                    self._feedback_pending += [(state.corpus, seed, ret)]
+                    state.iter += 1
+                    return ret
+                else:
+                    raise StopIteration
+            def seek(self, state, index):
+                state.iter = index
+            return set_seek(set_count(adaptive_impl_iter, lambda self: iteration), seek)
     return decorator
 
 def ApplyObserved(func):
-    if get_transform_type(func.func_name) == -1: # This is a persistent transform
+    func = snapshot_calls(func)
+    if get_transform_type(func.__name__) == -1: # This is a persistent transform
         raise Exception("ApplyList Cannot Modify Persistent Transforms")
     else: # Otherwise this is an iterative transform
         def iteration_impl_list(self, data, state):
@@ -768,10 +2261,9 @@ def ApplyObserved(func):
                     raise Exception("Transform instance was not given a burp wordlists object")
                 state.elements = list(self._wordlists.getObservedWords())
                 if (self._randomize_lists):
-                    random.shuffle(state.elements)
+                    state.random.shuffle(state.elements)
                 state.index = 0
-                func(self, data, state)
-                return
+                return func(self, data, state)
                 
             if (state.index < len(state.elements)):
                 data = state.elements[state.index]
@@ -781,11 +2273,16 @@ def ApplyObserved(func):
                 return ret
             else:    
                 raise StopIteration  
-        return iteration_impl_list
+        def count(self):
+            if self._wordlists == None:
+                return None
+            return len(list(self._wordlists.getObservedWords()))
+        return set_seek(set_count(iteration_impl_list, count), seek_elements)
     
 def ApplyList(*Lists):
     def decorator(func):
-        if get_transform_type(func.func_name) == -1: # This is a persistent transform
+        func = snapshot_calls(func)
+        if get_transform_type(func.__name__) == -1: # This is a persistent transform
             raise Exception("ApplyList Cannot Modify Persistent Transforms")
         else: # Otherwise this is an iterative transform
             def iteration_impl_list(self, data, state):
@@ -796,10 +2293,9 @@ def ApplyList(*Lists):
                     for list in Lists:
                         state.elements += list
                     if (self._randomize_lists):
-                        random.shuffle(state.elements)
+                        state.random.shuffle(state.elements)
                     state.index = 0
-                    func(self, data, state)
-                    return
+                    return func(self, data, state)
                     
                 if (state.index < len(state.elements)):
                     data = state.elements[state.index]
@@ -809,32 +2305,81 @@ def ApplyList(*Lists):
                     return ret
                 else:    
                     raise StopIteration  
-            return iteration_impl_list
+            return set_seek(set_count(iteration_impl_list, lambda self: sum([len(list) for list in Lists])), seek_elements)
     return decorator
     
-def ApplyFilelist(*paths):
+# ApplyFilelist options:
+#   stream=True        - read the wordlist lazily as tests are pulled instead of loading it
+#   shuffle_buffer=N   - with stream=True and randomized lists, shuffle through a buffer of N lines
+#   indexed=True       - index the line offsets of the wordlist and read elements on demand
+def ApplyFilelist(*paths, **options):
+    stream = options.pop("stream", False)
+    shuffle_buffer = options.pop("shuffle_buffer", 10000)
+    indexed = options.pop("indexed", False)
+    if len(options):
+        raise Exception("ApplyFilelist got unknown options: %s"%(", ".join(options)))
+    def count(self):
+        return sum([count_elements(path) for path in paths])
     def decorator(func):
-        if get_transform_type(func.func_name) == -1: # This is a persistent transform
+        func = snapshot_calls(func)
+        if get_transform_type(func.__name__) == -1: # This is a persistent transform
             raise Exception("ApplyList Cannot Modify Persistent Transforms")
+        elif stream: # Otherwise this is an iterative transform reading its wordlist lazily
+            def iteration_impl_stream(self, data, state):
+
+                if state.init:
+                    state.iter = 0
+                    state.index = 0
+                    shuffle = 0
+                    if (self._randomize_lists):
+                        shuffle = shuffle_buffer
+                    # the shuffle seed is drawn once per init from the (seeded) stream
+                    # of the operation, a catch-up rewind reuses it
+                    seed = state.random.getrandbits(64)
+                    # a new init reopens the files instead of creating a new stream
+                    if getattr(state, "stream", None) == None:
+                        state.stream = LineStream(paths, shuffle, seed, self._binary)
+                    else:
+                        state.stream.rewind(shuffle, seed)
+                    return func(self, data, state)
+
+                # a stream can only seek by reading up to the element, catch up with
+                # a position set by seek() or restore() and start over for a rewind
+                if state.stream.position > state.index:
+                    shuffle = 0
+                    if (self._randomize_lists):
+                        shuffle = shuffle_buffer
+                    state.stream.rewind(shuffle, state.stream.seed)
+                while state.stream.position < state.index:
+                    state.stream.next()
+                data = state.stream.next()
+                state.index += 1
+                ret = func(self, data, state)
+                state.iter += 1
+                return ret
+            return set_seek(set_count(iteration_impl_stream, count), seek_elements)
         else: # Otherwise this is an iterative transform
             def iteration_impl_list(self, data, state):
                     
                 if state.init:
                     state.iter = 0
-                    state.elements = []
-                    for path in paths:
-                        with open(path) as f:
-                            elems = f.read().split('\n')
-                            elemsf = []
-                            for i in range(len(elems)):
-                                if elems[i].strip() == "": continue
-                                elemsf += [elems[i].strip()]
-                            state.elements += elemsf
-                    if (self._randomize_lists):
-                        random.shuffle(state.elements)
+                    if indexed:
+                        # the index is built once, a new init reuses it
+                        if getattr(state, "lines", None) == None:
+                            state.lines = IndexedLines([open_index(path, payload_index_path(path)) for path in paths], binary=self._binary)
+                        state.elements = state.lines
+                        if (self._randomize_lists):
+                            state.elements = state.lines.shuffled(state.random)
+                    else:
+                        # the wordlist is read once, a new init only shuffles it again
+                        if getattr(state, "lines", None) == None:
+                            state.lines = list(LineStream(paths, binary=self._binary))
+                        state.elements = state.lines
+                        if (self._randomize_lists):
+                            state.elements = list(state.lines)
+                            state.random.shuffle(state.elements)
                     state.index = 0
-                    func(self, data, state)
-                    return
+                    return func(self, data, state)
                     
                 if (state.index < len(state.elements)):
                     data = state.elements[state.index]
@@ -844,10 +2389,18 @@ def ApplyFilelist(*paths):
                     return ret
                 else:    
                     raise StopIteration  
-            return iteration_impl_list
+            return set_seek(set_count(iteration_impl_list, count), seek_elements)
     return decorator
+
+# Builtin payload files keep their line offset index next to them (generated by
+# install.sh or on first use), any other file is only indexed in memory
+def payload_index_path(path):
+    payload_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "PayloadStrings")
+    if os.path.dirname(os.path.abspath(path)) != payload_dir:
+        return None
+    return os.path.splitext(path)[0] + ".idx"
  
-def ApplyPayloads(*keywords):
+def ApplyPayloads(*keywords, **options):
     if IS_BURP:
         stream = burp.RequestEngine.getResourceAsStream("/Lib/haptyc/PayloadStrings/manifest.txt")
         manifest = GetDataFromStream(stream).replace(".pay","").split("\n")
@@ -868,6 +2421,7 @@ def ApplyPayloads(*keywords):
             raise Exception("ApplyPayloads could not find '%s.pay'"%(keyword))
         
     if IS_BURP:
+        # payloads are packaged inside of the jar, options for file access do not apply
         inargs = []
         for keyword in keywords:
             stream = burp.RequestEngine.getResourceAsStream("/Lib/haptyc/PayloadStrings/"+keyword+".pay")
@@ -877,5 +2431,8 @@ def ApplyPayloads(*keywords):
         inargs = []
         for keyword in keywords:
             inargs += [os.path.dirname(manifestFile)+"/"+keyword+".pay"]
-        return ApplyFilelist(*inargs)
+        # builtin payloads are indexed unless they are streamed
+        if not options.get("stream", False):
+            options.setdefault("indexed", True)
+        return ApplyFilelist(*inargs, **options)
 
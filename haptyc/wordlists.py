@@ -0,0 +1,300 @@
+# Project: Haptyc
+# Author: Evan Custodio (@defparam)
+#
+# Copyright 2021 Evan Custodio
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import random
+import struct
+import array
+import bisect
+import os, sys
+
+try: # mmap is not available in a jython context
+    import mmap
+except ImportError:
+    mmap = None
+
+try:
+    xrange
+except NameError:
+    xrange = range
+
+# A wordlist element is every stripped non-empty line of a file
+
+# wordlist files are read as bytes, elements are decoded with latin-1 (as bytes_to_str
+# does) so that any byte can be read. Binary elements (for raw bytes requests) are kept
+# as the bytes of the file.
+def decode_line(line, binary=False):
+    if (sys.version_info[0] >= 3) and not binary:
+        return line.decode("latin-1")
+    return line
+
+# Reads the elements of a set of files lazily so that a wordlist never has to be
+# held in memory. When a shuffle buffer size is given, elements are served in
+# random order out of a bounded buffer that is refilled from the files. The stream
+# draws from its own random stream so that the shuffle order only depends on the
+# seed and the number of elements served, not on when they are read
+class LineStream(object):
+    def __init__(self, paths, shuffle=0, seed=None, binary=False):
+        self._paths = paths
+        self._file = None
+        self._binary = binary
+        self.rewind(shuffle, seed)
+
+    # start reading again from the first line of the first file, the same seed
+    # gives the same shuffle order
+    def rewind(self, shuffle=0, seed=None):
+        self.close()
+        self._path = 0
+        self._shuffle = shuffle
+        self.seed = seed
+        self._random = random.Random(seed)
+        self._buffer = []
+        self.position = 0 # number of elements served since the last rewind
+
+    def close(self):
+        if self._file != None:
+            self._file.close()
+            self._file = None
+
+    def _readline(self):
+        while True:
+            if self._file == None:
+                if self._path == len(self._paths):
+                    return None
+                self._file = open(self._paths[self._path], "rb")
+                self._path += 1
+            line = self._file.readline()
+            if line == b"":
+                self.close()
+                continue
+            line = line.strip()
+            if line == b"":
+                continue
+            return decode_line(line, self._binary)
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        line = self._next()
+        self.position += 1
+        return line
+
+    def _next(self):
+        if self._shuffle <= 0:
+            line = self._readline()
+            if line == None:
+                raise StopIteration
+            return line
+
+        # top up the shuffle buffer and serve a random element out of it
+        while len(self._buffer) < self._shuffle:
+            line = self._readline()
+            if line == None:
+                break
+            self._buffer += [line]
+        if len(self._buffer) == 0:
+            raise StopIteration
+        i = self._random.randint(0, len(self._buffer)-1)
+        self._buffer[i], self._buffer[-1] = self._buffer[-1], self._buffer[i]
+        return self._buffer.pop()
+
+    __next__ = next
+
+# Line offset index files (.idx) are a small header followed by the byte offset of
+# every element as a little endian 32-bit integer:
+#   magic "HIDX", version, size and mtime of the indexed file, number of elements
+INDEX_MAGIC = b"HIDX"
+INDEX_VERSION = 2
+INDEX_HEADER = struct.Struct("<4sIQdI")
+
+# In-memory cache of built indexes: (path, size, mtime) -> offsets
+_offsets_cache = {}
+
+# scan a file once and return the byte offsets of all of its elements
+def build_offsets(path):
+    offsets = array.array("I")
+    if os.path.getsize(path) >= 2**32:
+        offsets = array.array("L")
+        if offsets.itemsize < 8:
+            raise Exception("File is too large to index: %s"%(path))
+    pos = 0
+    with open(path, "rb") as f:
+        for line in f:
+            if line.strip() != b"":
+                offsets.append(pos)
+            pos += len(line)
+    return offsets
+
+def write_index(path, idxpath):
+    offsets = build_offsets(path)
+    if offsets.typecode != "I":
+        raise Exception("File is too large for an index file: %s"%(path))
+    if sys.byteorder == "big":
+        offsets.byteswap()
+    stat = os.stat(path)
+    with open(idxpath, "wb") as f:
+        f.write(INDEX_HEADER.pack(INDEX_MAGIC, INDEX_VERSION, stat.st_size, stat.st_mtime, len(offsets)))
+        f.write(offsets.tostring() if sys.version_info[0] < 3 else offsets.tobytes())
+
+def read_index(path, idxpath):
+    with open(idxpath, "rb") as f:
+        header = f.read(INDEX_HEADER.size)
+        if len(header) != INDEX_HEADER.size:
+            return None
+        magic, version, size, mtime, count = INDEX_HEADER.unpack(header)
+        if (magic != INDEX_MAGIC) or (version != INDEX_VERSION):
+            return None
+        # an index is stale once its file is modified, even if the size stays the same
+        stat = os.stat(path)
+        if (size != stat.st_size) or (mtime != stat.st_mtime):
+            return None
+        offsets = array.array("I")
+        data = f.read(count * offsets.itemsize)
+        if len(data) != count * offsets.itemsize:
+            return None
+        if sys.version_info[0] < 3:
+            offsets.fromstring(data)
+        else:
+            offsets.frombytes(data)
+    if sys.byteorder == "big":
+        offsets.byteswap()
+    return offsets
+
+# Return the line offsets of a file. Offsets are cached in memory and, if an index
+# file path is given, on disk. A stale or missing index file is rebuilt.
+def get_offsets(path, idxpath=None):
+    stat = os.stat(path)
+    key = (os.path.abspath(path), stat.st_size, stat.st_mtime)
+    if key in _offsets_cache:
+        return _offsets_cache[key]
+
+    offsets = None
+    if (idxpath != None) and os.path.exists(idxpath):
+        offsets = read_index(path, idxpath)
+    if offsets == None:
+        offsets = build_offsets(path)
+        if (idxpath != None) and (offsets.typecode == "I"):
+            try:
+                write_index(path, idxpath)
+            except (IOError, OSError): # read-only installs keep the in-memory index only
+                pass
+    _offsets_cache[key] = offsets
+    return offsets
+
+# In-memory cache of element counts: (path, size, mtime) -> count
+_count_cache = {}
+
+# count the elements of a file without keeping its offsets around
+def count_elements(path):
+    stat = os.stat(path)
+    key = (os.path.abspath(path), stat.st_size, stat.st_mtime)
+    if key in _offsets_cache:
+        return len(_offsets_cache[key])
+    if key not in _count_cache:
+        count = 0
+        with open(path, "rb") as f:
+            for line in f:
+                if line.strip() != b"":
+                    count += 1
+        _count_cache[key] = count
+    return _count_cache[key]
+
+# Random access to the elements of a single file through its line offsets. The
+# file is memory mapped when possible and read with seeks otherwise.
+class LineIndex(object):
+    def __init__(self, path, idxpath=None):
+        self.path = path
+        self._offsets = get_offsets(path, idxpath)
+        self._file = open(path, "rb")
+        self._map = None
+        if (mmap != None) and len(self._offsets):
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __len__(self):
+        return len(self._offsets)
+
+    def __getitem__(self, i):
+        return decode_line(self.raw(i))
+
+    # return the bytes of an element
+    def raw(self, i):
+        start = self._offsets[i]
+        if self._map != None:
+            end = self._map.find(b"\n", start)
+            if end == -1:
+                end = len(self._map)
+            line = self._map[start:end]
+        else:
+            self._file.seek(start)
+            line = self._file.readline()
+        return line.strip()
+
+    def close(self):
+        if self._map != None:
+            self._map.close()
+            self._map = None
+        self._file.close()
+
+# In-memory cache of opened indexes so that every transform shares the same file handle
+_index_cache = {}
+
+def open_index(path, idxpath=None):
+    stat = os.stat(path)
+    key = (os.path.abspath(path), stat.st_size, stat.st_mtime)
+    if key not in _index_cache:
+        _index_cache[key] = LineIndex(path, idxpath)
+    return _index_cache[key]
+
+# A read-only sequence over the elements of several indexed files in order, or in
+# the order of a permutation of element numbers, binary elements are the bytes of the files
+class IndexedLines(object):
+    def __init__(self, indexes, order=None, binary=False):
+        self._indexes = indexes
+        self._order = order
+        self._binary = binary
+        self._starts = []
+        total = 0
+        for index in indexes:
+            self._starts += [total]
+            total += len(index)
+        self._len = total
+
+    def __len__(self):
+        return self._len
+
+    def __getitem__(self, i):
+        if (i < 0) or (i >= self._len):
+            raise IndexError("element index out of range")
+        if self._order != None:
+            i = self._order[i]
+        n = bisect.bisect_right(self._starts, i) - 1
+        return decode_line(self._indexes[n].raw(i - self._starts[n]), self._binary)
+
+    def __iter__(self):
+        for i in xrange(self._len):
+            yield self[i]
+
+    # return a view of the same elements in a random order
+    def shuffled(self, rng=None):
+        order = array.array("I" if self._len < 2**32 else "L", xrange(self._len))
+        (rng or random).shuffle(order)
+        return IndexedLines(self._indexes, order, self._binary)
+
+# build the index file of every given file
+if __name__ == "__main__":
+    for path in sys.argv[1:]:
+        write_index(path, os.path.splitext(path)[0] + ".idx")
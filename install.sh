@@ -4,6 +4,8 @@ SCRIPT_DIR="$( cd "$( dirname "${BASH_SOURCE[0]}" )" &> /dev/null && pwd )"
 
 cd "$SCRIPT_DIR/haptyc/PayloadStrings"
 ls -a *.pay | sort > manifest.txt
+# build the line offset index of every payload file
+python3 ../wordlists.py *.pay 2>/dev/null || python ../wordlists.py *.pay
 cd $SCRIPT_DIR
 
 TMPDIR=$(mktemp -d)